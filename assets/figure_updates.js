@@ -0,0 +1,100 @@
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    charts: {
+        // writes a graph's figure from its update store: {figure: ...} replaces it, {delta: {traces: [...]}}
+        // trims each trace where its resent tail starts and appends the tail
+        apply: function (update, figure) {
+            if (!update) {
+                return window.dash_clientside.no_update;
+            }
+            if (update.figure || !figure) {
+                return update.figure || window.dash_clientside.no_update;
+            }
+            var data = figure.data.slice();
+            update.delta.traces.forEach(function (tail) {
+                if (tail.trace) {
+                    data[tail.index] = tail.trace;
+                    return;
+                }
+                var trace = Object.assign({}, data[tail.index]);
+                var x = trace.x || [];
+                var cut = x.length;
+                if (tail.x.length) {
+                    // x holds ISO date strings, which sort in time order
+                    var lo = 0, hi = x.length;
+                    while (lo < hi) {
+                        var mid = (lo + hi) >> 1;
+                        if (x[mid] < tail.x[0]) {
+                            lo = mid + 1;
+                        } else {
+                            hi = mid;
+                        }
+                    }
+                    cut = lo;
+                }
+                Object.keys(tail).forEach(function (field) {
+                    if (field !== 'index') {
+                        trace[field] = (trace[field] || []).slice(0, cut).concat(tail[field]);
+                    }
+                });
+                data[tail.index] = trace;
+            });
+            return Object.assign({}, figure, {data: data});
+        },
+
+        // follows /stream for the chart in graph-state and applies each pushed update straight to the plot;
+        // returns whether updates are being pushed, which slows the chart's polling down to a safety net. It is
+        // also called every few seconds by stream-check, so a stream the server refused (the worker is at its
+        // stream limit) or closed for good goes back to normal polling, and is retried a minute later
+        subscribe: function (state) {
+            var charts = window.dash_clientside.charts;
+            var pushing = charts.connect(state && JSON.stringify(state.key));
+            if (pushing === charts.pushing) {
+                return window.dash_clientside.no_update;
+            }
+            charts.pushing = pushing;
+            return pushing;
+        },
+
+        connect: function (key) {
+            var charts = window.dash_clientside.charts;
+            if (charts.source && charts.sourceKey === key) {
+                if (charts.source.readyState !== window.EventSource.CLOSED) {
+                    return true;
+                }
+                charts.source = null;
+                charts.retryKey = key;
+                charts.retryAt = Date.now() + 60000;
+                return false;
+            }
+            if (charts.source) {
+                charts.source.close();
+                charts.source = null;
+            }
+            if (!key || !window.EventSource || (charts.retryKey === key && Date.now() < charts.retryAt)) {
+                return false;
+            }
+            var source = new EventSource('stream?key=' + encodeURIComponent(key));
+            source.onmessage = function (event) {
+                var gd = document.querySelector('#graph .js-plotly-plot');
+                if (!gd || !gd.data || !window.Plotly) {
+                    return;
+                }
+                var figure = charts.apply(JSON.parse(event.data), {data: gd.data, layout: gd.layout});
+                window.Plotly.react(gd, figure.data, figure.layout);
+            };
+            source.addEventListener('resync', function () {
+                // the server dropped updates for this reader; reconnecting starts again from a full snapshot
+                source.close();
+                if (charts.source === source) {
+                    charts.source = null;
+                    setTimeout(function () {
+                        charts.connect(key);
+                    }, 1000);
+                }
+            });
+            charts.source = source;
+            charts.sourceKey = key;
+            return true;
+        }
+    }
+});
@@ -0,0 +1,182 @@
+import contextlib
+import fcntl
+import json
+import os
+import threading
+import time
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+from data_cache import interval_ttl, merge_tail
+from resample import covers
+
+COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+# a partition is patched with its latest bars, but fully re-downloaded this often to pick up adjustments
+FULL_RELOAD_AFTER = 6 * 3600
+
+
+class BarStore:
+    """On-disk OHLCV bars partitioned by symbol and interval.
+
+    Each partition keeps the UTC timestamps in index-<v>.npy and the five price/volume columns as rows of a
+    float64 (5, n) array in ohlcv-<v>.npy, so a column is contiguous on disk and the frame is built on a
+    read-only memory map without copying. meta.json names the current version and is swapped atomically.
+    Updates hold an flock on the partition, so workers sharing the store never write the same version, and
+    every file is written under a temporary name and renamed into place, so a mapped version is never rewritten.
+    """
+
+    def __init__(self, root, offline=False):
+        self.root = root
+        self.offline = offline
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def _dir(self, tick, interval):
+        return os.path.join(self.root, quote(tick, safe=''), interval)
+
+    def _lock(self, tick, interval):
+        with self._locks_guard:
+            return self._locks.setdefault((tick, interval), threading.Lock())
+
+    @contextlib.contextmanager
+    def _locked(self, tick, interval):
+        # the thread lock orders this process's threads; the flock orders the other processes
+        path = self._dir(tick, interval)
+        os.makedirs(path, exist_ok=True)
+        with self._lock(tick, interval), open(os.path.join(path, 'lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _save(self, path, name, array):
+        tmp = os.path.join(path, '%s.%d.tmp' % (name, os.getpid()))
+        with open(tmp, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp, os.path.join(path, name))
+
+    def read_meta(self, tick, interval):
+        try:
+            with open(os.path.join(self._dir(tick, interval), 'meta.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def read(self, tick, interval):
+        for _ in range(2):
+            meta = self.read_meta(tick, interval)
+            if meta is None:
+                return None, None
+            path = self._dir(tick, interval)
+            try:
+                stamps = np.load(os.path.join(path, 'index-%d.npy' % meta['version']), mmap_mode='r')
+                values = np.load(os.path.join(path, 'ohlcv-%d.npy' % meta['version']), mmap_mode='r')
+            except FileNotFoundError:
+                # a writer replaced this version between reading meta.json and opening the arrays
+                continue
+            index = pd.DatetimeIndex(np.asarray(stamps).view('M8[ns]'))
+            if meta['tz'] is not None:
+                index = index.tz_localize('UTC').tz_convert(meta['tz'])
+            return pd.DataFrame(values.T, index=index, columns=COLUMNS, copy=False), meta
+        return None, None
+
+    def write(self, tick, interval, df, period, full_load):
+        # callers hold _locked(tick, interval)
+        path = self._dir(tick, interval)
+        os.makedirs(path, exist_ok=True)
+        old = self.read_meta(tick, interval)
+        version = 0 if old is None else old['version'] + 1
+        index = df.index
+        tz = None if index.tz is None else str(index.tz)
+        if tz is not None:
+            index = index.tz_convert('UTC').tz_localize(None)
+        self._save(path, 'index-%d.npy' % version, index.values.view('i8'))
+        values = np.ascontiguousarray(df.reindex(columns=COLUMNS).to_numpy(dtype='f8').T)
+        self._save(path, 'ohlcv-%d.npy' % version, values)
+        meta = {'version': version, 'tz': tz, 'period': period, 'full_load': full_load, 'updated': time.time(),
+                'rows': len(df)}
+        tmp = os.path.join(path, 'meta.json.%d.tmp' % os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(path, 'meta.json'))
+        if old is not None:
+            for name in ('index-%d.npy', 'ohlcv-%d.npy'):
+                try:
+                    os.remove(os.path.join(path, name % old['version']))
+                except OSError:
+                    pass
+
+    def _plan(self, tick, period, interval):
+        # what a load needs from upstream, under the partition lock: (stored frame, meta, period, start), with
+        # period None when the stored frame is fresh, start set for a tail refresh and None for a full download
+        df, meta = self.read(tick, interval)
+        now = time.time()
+        if df is not None and not df.empty and covers(meta['period'], period) \
+                and now - meta['full_load'] < FULL_RELOAD_AFTER:
+            if now - meta['updated'] < interval_ttl(interval):
+                return df, meta, None, None
+            # only the session of the last bar onwards is requested; yfinance takes day-resolution start dates
+            return df, meta, period, df.index[-1].strftime('%Y-%m-%d')
+        if meta is not None and covers(meta['period'], period):
+            period = meta['period']
+        return None, None, period, None
+
+    def _update(self, tick, interval, plan, fetched):
+        df, meta, period, start = plan
+        fetched = fetched[[c for c in COLUMNS if c in fetched.columns]]
+        if start is not None:
+            df = merge_tail(df, fetched)
+            self.write(tick, interval, df, meta['period'], meta['full_load'])
+            return df
+        self.write(tick, interval, fetched, period, time.time())
+        return fetched
+
+    def load(self, tick, period, interval, fetch):
+        # fetch(tick, period, interval, start=None) is only called for ranges the partition doesn't hold:
+        # the whole period when the stored history is too short, otherwise the bars since the last stored session
+        if self.offline:
+            df, meta = self.read(tick, interval)
+            if df is None:
+                raise LookupError('%s %s is not in the bar store' % (tick, interval))
+            return df
+        # a worker that waited on another's update reads the fresh partition instead of fetching again
+        with self._locked(tick, interval):
+            plan = self._plan(tick, period, interval)
+            if plan[2] is None:
+                return plan[0]
+            return self._update(tick, interval, plan, fetch(tick, plan[2], interval, start=plan[3]))
+
+    def load_many(self, ticks, period, interval, fetch_many):
+        """Loads several symbols over one period and interval, downloading what they miss in as few calls as
+        possible: fetch_many(ticks, period, interval, start=None) returns {tick: frame} and is called once per
+        distinct range needed. Each partition is updated under its own lock; symbols that are neither stored
+        nor returned are left out of the result.
+        """
+        ticks = sorted(set(ticks))
+        loaded = {}
+        if self.offline:
+            for tick in ticks:
+                df, meta = self.read(tick, interval)
+                if df is not None:
+                    loaded[tick] = df
+            return loaded
+        with contextlib.ExitStack() as stack:
+            # taken in sorted order, so two overlapping batches can't each hold a lock the other waits on
+            for tick in ticks:
+                stack.enter_context(self._locked(tick, interval))
+            groups = {}
+            for tick in ticks:
+                plan = self._plan(tick, period, interval)
+                if plan[2] is None:
+                    loaded[tick] = plan[0]
+                else:
+                    groups.setdefault(plan[2:], []).append((tick, plan))
+            for (fetch_period, start), group in groups.items():
+                fetched = fetch_many([tick for tick, plan in group], fetch_period, interval, start=start)
+                for tick, plan in group:
+                    if tick in fetched:
+                        loaded[tick] = self._update(tick, interval, plan, fetched[tick])
+        return loaded
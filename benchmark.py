@@ -0,0 +1,236 @@
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from providers import LocalProvider, Provider
+
+# series sizes the app actually serves: (ticker, period, interval, years kept, or None for the whole period)
+FIXTURES = {
+    '1y-1d': ('^NSEI', '1y', '1d', None),
+    '5d-1m': ('^NSEI', '5d', '1m', None),
+    'max-1mo': ('^NSEI', 'max', '1mo', None),
+    '20y-1d': ('^NSEI', 'max', '1d', 20),
+}
+COMPARE = ['RELIANCE.NS', 'TCS.NS']
+INDICATORS = ['mov20', 'mov50', 'mov100', 'mov200', 'bbands', 'ema', 'sar', 'ichi', 'bulleng', 'beareng']
+QUERIES = ['rel', 'reliance', 'bank', 'tata', 'nifty', 'inds', 'hdfc', 'a', 'zzzz']
+# the synthetic clock the fixtures end on, so every run sees the same bars
+END = '2021-06-15 11:03'
+
+
+class FixtureProvider(Provider):
+    """Serves pre-generated frames, so fetch timings measure the app's own path rather than bar synthesis."""
+
+    def __init__(self, source, years=None):
+        self.source = source
+        self.years = years or {}
+        self.frames = {}
+
+    def history(self, tick, period, interval, start=None):
+        key = (tick, period, interval)
+        if key not in self.frames:
+            df = self.source.history(tick, period, interval)
+            if key in self.years:
+                df = df[df.index >= df.index[-1] - pd.DateOffset(years=self.years[key])]
+            self.frames[key] = df
+        df = self.frames[key]
+        if start is not None:
+            first = pd.Timestamp(start)
+            if df.index.tz is not None:
+                first = first.tz_localize(df.index.tz)
+            return df[df.index >= first]
+        return df
+
+
+def measure(func, repeat, setup=None):
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return times
+
+
+def summary(times, **extra):
+    times = sorted(times)
+    out = {
+        'median_ms': round(1000 * statistics.median(times), 4),
+        'min_ms': round(1000 * times[0], 4),
+        'p95_ms': round(1000 * times[min(len(times) - 1, int(0.95 * len(times)))], 4),
+        'runs': len(times),
+    }
+    out.update(extra)
+    return out
+
+
+def callback_body(spec, output, inputs, state=(), changed=None):
+    # the /_dash-update-component request the browser sends; spec is the callback's inputs and state
+    return {
+        'output': output,
+        'outputs': [{'id': o.split('.')[0], 'property': o.split('.')[1]} for o in output.strip('.').split('...')]
+        if output.startswith('..') else {'id': output.split('.')[0], 'property': output.split('.')[1]},
+        'inputs': [{'id': i['id'], 'property': i['property'], 'value': v} for i, v in zip(spec['inputs'], inputs)],
+        'state': [{'id': s['id'], 'property': s['property'], 'value': v} for s, v in zip(spec['state'], state)],
+        'changedPropIds': changed or ['%s.%s' % (spec['inputs'][0]['id'], spec['inputs'][0]['property'])],
+    }
+
+
+def dash_post(client, app, output, inputs, state=(), changed=None):
+    # drives a callback the way the browser does, through Dash's own dispatch
+    body = callback_body(app.callback_map[output], output, inputs, state, changed)
+    response = client.post('/_dash-update-component', json=body)
+    if response.status_code not in (200, 204):
+        raise RuntimeError('%s returned %s' % (output, response.status_code))
+    return response.data
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(repeat=5):
+    # one bar store directory for the whole run, emptied before every cold repetition and removed at the end
+    with tempfile.TemporaryDirectory(prefix='bench-bars-') as bars:
+        return measure_all(repeat, bars)
+
+
+def measure_all(repeat, bars):
+    os.environ['MARKET_DATA_PROVIDER'] = 'local'
+    os.environ.setdefault('MARKET_DATA_END', END)
+    os.environ['BAR_STORE_DIR'] = bars
+    os.environ.pop('BAR_STORE_OFFLINE', None)
+    import main
+    from bar_store import BarStore
+    from figures import encode
+    from indicators import IndicatorEngine
+    from symbols import SymbolIndex
+
+    main.provider = FixtureProvider(LocalProvider(end=os.environ['MARKET_DATA_END']),
+                                    {(t, p, i): y for t, p, i, y in FIXTURES.values() if y})
+    client = main.server.test_client()
+    graph = '..graph-update.data...graph-state.data..'
+    tab2 = '..tab2-graph-A-update.data...tab2-graph-B-update.data...tab2-graph-C-update.data...tab2-graph-state.data..'
+    hover = '..displayhover.children...displayhover.style..'
+
+    def reset():
+        for cache in (main.ohlcv_cache, main.latest_frames, main.chart_frames, main.figure_cache, main.trace_cache):
+            cache.clear()
+        main.indicator_engine = IndicatorEngine()
+        for entry in os.listdir(bars):
+            shutil.rmtree(os.path.join(bars, entry))
+        main.bar_store = BarStore(bars)
+
+    results = {}
+    for name, (tick, period, interval, years) in FIXTURES.items():
+        # generate the fixture up front
+        main.provider.history(tick, period, interval)
+        results[name + '/fetch_cold'] = summary(measure(lambda: main.fetch_data(period, interval, tick), repeat, reset))
+        df = main.fetch_data(period, interval, tick)
+        results[name + '/fetch_warm'] = summary(measure(lambda: main.fetch_data(period, interval, tick), repeat))
+
+        def indicators():
+            bound = IndicatorEngine().bind(df)
+            for ind in INDICATORS:
+                for overlay, params, field, style in main.OVERLAYS.get(ind, []):
+                    bound.get(overlay, **params)
+            return bound
+        results[name + '/indicators'] = summary(measure(indicators, repeat), bars=len(df))
+        pattern = indicators().get('engulfing')
+        results[name + '/engulfing_overlay'] = summary(measure(
+            lambda: (main.engulfing_trace(df, pattern, 100, 'green', 'Bullish Engulfing'),
+                     main.engulfing_trace(df, pattern, -100, 'red', 'Bearish Engulfing')), repeat))
+
+        def figure():
+            runs, view = main.chart_view(df, None)
+            return main.chart_figure(df, name, view, runs, [df], [name], tick, period, interval, INDICATORS, [],
+                                     'offset')
+        results[name + '/figure_build'] = summary(measure(figure, repeat, reset))
+        built = figure()
+        body = encode(built)
+        results[name + '/serialize'] = summary(measure(lambda: encode(built), repeat), bytes=len(body))
+
+        inputs = [tick, period, interval, 0, INDICATORS, COMPARE, None, 'offset']
+        results[name + '/callback1_cold'] = summary(measure(
+            lambda: dash_post(client, main.app, graph, inputs, [None]), repeat, reset))
+        payload = dash_post(client, main.app, graph, inputs, [None])
+        results[name + '/callback1_warm'] = summary(measure(
+            lambda: dash_post(client, main.app, graph, inputs, [None]), repeat), bytes=len(payload))
+        x = df.index[len(df) // 2].strftime('%Y-%m-%d %H:%M')
+        results[name + '/hover'] = summary(measure(
+            lambda: dash_post(client, main.app, hover, [{'points': [{'x': x}]}], [tick, period, interval, COMPARE,
+                                                                               None, 'offset']), repeat))
+
+    tab2_inputs = [main.app.layout['tab2_tickinput'].value]
+    for pane in 'ABC':
+        p = main.app.layout['tab2-periodinput-%s' % pane].value
+        tab2_inputs += [p, main.period_int(p)]
+    tab2_inputs.append(0)
+    results['tab2_callback_cold'] = summary(measure(
+        lambda: dash_post(client, main.app, tab2, tab2_inputs, [None]), repeat, reset))
+    results['tab2_callback_warm'] = summary(measure(
+        lambda: dash_post(client, main.app, tab2, tab2_inputs, [None]), repeat))
+
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stocksymbols.csv')
+    results['symbols_load'] = summary(measure(lambda: SymbolIndex.from_csv(path), repeat))
+    results['symbols_search'] = summary(measure(lambda: [main.symbols.search(q) for q in QUERIES], repeat * 20),
+                                        queries=len(QUERIES))
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'repeat': repeat,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def compare(old, new, threshold):
+    # median ratio per benchmark; returns the names that got slower by more than threshold
+    regressions = []
+    print('%-32s %12s %12s %8s' % ('benchmark', 'old ms', 'new ms', 'ratio'))
+    for name in sorted(set(old['results']) & set(new['results'])):
+        a, b = old['results'][name]['median_ms'], new['results'][name]['median_ms']
+        ratio = b / a if a else float('inf')
+        flag = ''
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = ' slower'
+        print('%-32s %12.3f %12.3f %8.2f%s' % (name, a, b, ratio, flag))
+    return regressions
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Time the chart pipeline offline on synthetic bars.')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='write results as JSON here (default: stdout)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files instead')
+    parser.add_argument('--threshold', type=float, default=0.2, help='slowdown that counts as a regression')
+    args = parser.parse_args()
+    if args.compare:
+        with open(args.compare[0]) as f_old, open(args.compare[1]) as f_new:
+            slower = compare(json.load(f_old), json.load(f_new), args.threshold)
+        sys.exit(1 if slower else 0)
+    report = run(args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
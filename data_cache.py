@@ -0,0 +1,160 @@
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+# seconds a downloaded series stays fresh, by bar interval
+INTERVAL_TTL = {
+    '1m': 30,
+    '2m': 60,
+    '5m': 120,
+    '15m': 300,
+    '30m': 600,
+    '60m': 900,
+    '90m': 900,
+    '1h': 900,
+    '1d': 1800,
+    '5d': 3600,
+    '1wk': 3 * 3600,
+    '1mo': 6 * 3600,
+    '3mo': 12 * 3600,
+}
+DEFAULT_TTL = 300
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# calendar length of the yfinance periods; 'Nd' periods count trading days instead
+PERIOD_OFFSETS = {
+    '1mo': pd.DateOffset(months=1),
+    '3mo': pd.DateOffset(months=3),
+    '6mo': pd.DateOffset(months=6),
+    '1y': pd.DateOffset(years=1),
+    '2y': pd.DateOffset(years=2),
+    '5y': pd.DateOffset(years=5),
+    '10y': pd.DateOffset(years=10),
+}
+
+
+def interval_ttl(interval):
+    return INTERVAL_TTL.get(interval, DEFAULT_TTL)
+
+
+def period_start(period, end):
+    if period in PERIOD_OFFSETS:
+        return end - PERIOD_OFFSETS[period]
+    if period == 'ytd':
+        return end.normalize().replace(month=1, day=1)
+    return None
+
+
+def trim_period(df, period):
+    if df.empty:
+        return df
+    if period.endswith('d') and period[:-1].isdigit():
+        days = df.index.normalize()
+        keep = days.unique()[-int(period[:-1]):]
+        return df[days >= keep[0]]
+    start = period_start(period, df.index[-1])
+    if start is None:
+        return df
+    return df[df.index >= start]
+
+
+def merge_tail(df, tail):
+    # rows from the tail replace everything at or after its first bar: the still-forming
+    # candle is revised in place and any newer bars are appended
+    if tail.empty:
+        return df
+    if df.empty:
+        return tail
+    head = df[df.index < tail.index[0]]
+    return pd.concat([head, tail[df.columns.intersection(tail.columns)]])
+
+
+def frame_nbytes(df):
+    return int(df.memory_usage(index=True).sum())
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a per-key TTL and whose total size is capped in bytes."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, ttl=None, sizeof=frame_nbytes, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[1] is not None and entry[1] <= self.clock()):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, ttl=None):
+        if ttl is None and self.ttl is not None:
+            ttl = self.ttl(key)
+        expires = None if ttl is None else self.clock() + ttl
+        size = self.sizeof(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            if size > self.max_bytes:
+                return value
+            self._entries[key] = (value, expires, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[2]
+                self.evictions += 1
+        return value
+
+    def ttl_left(self, key):
+        # seconds until key expires, without counting as a lookup; None when it is absent or already expired
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] is None:
+                return float('inf')
+            left = entry[1] - self.clock()
+            return left if left > 0 else None
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            self._bytes -= entry[2]
+            return entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
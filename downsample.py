@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+
+# below about two pixels a candle stops being readable; lines keep one point per candle slot as well, which
+# LTTB makes indistinguishable from the full series at chart size
+PIXELS_PER_CANDLE = 2
+PIXELS_PER_POINT = 2
+# share of the budget spent on the bars either side of a zoomed window, so panning shows context until the
+# re-slice for the new range arrives
+SIDE_SHARE = 0.25
+
+
+def viewport(relayout):
+    # the x range set by a relayoutData event: [start, end] after a zoom or pan, None once the axis is
+    # autoranged again, False for events that leave the x axis alone (resizes, drawn shapes)
+    if not relayout:
+        return False
+    if relayout.get('xaxis.autorange'):
+        return None
+    if 'xaxis.range[0]' in relayout and 'xaxis.range[1]' in relayout:
+        return [relayout['xaxis.range[0]'], relayout['xaxis.range[1]']]
+    if 'xaxis.range' in relayout:
+        return list(relayout['xaxis.range'])
+    return False
+
+
+def visible(index, window):
+    # positions [lo, hi) of the bars inside window, a pair of plotly axis date strings
+    if not window or not len(index):
+        return 0, len(index)
+    start, end = pd.Timestamp(window[0]), pd.Timestamp(window[1])
+    if index.tz is not None:
+        start, end = start.tz_localize(index.tz), end.tz_localize(index.tz)
+    lo, hi = index.searchsorted(start), index.searchsorted(end, side='right')
+    if hi <= lo:
+        return 0, len(index)
+    return lo, hi
+
+
+def segments(n, lo, hi, points):
+    # (start, stop, budget) runs covering n bars: the visible ones at full budget, the rest coarser
+    if lo == 0 and hi == n:
+        return [(0, n, points)]
+    side = max(1, int(points * SIDE_SHARE))
+    return [s for s in [(0, lo, side), (lo, hi, points), (hi, n, side)] if s[1] > s[0]]
+
+
+def bucket_size(start, stop, budget):
+    return max(1, -(-(stop - start) // max(1, budget)))
+
+
+def bucket_starts(start, stop, budget):
+    # equal-count buckets counted from the segment start, so bars appended at the tail leave earlier buckets alone
+    return np.arange(start, stop, bucket_size(start, stop, budget))
+
+
+def bucket_sizes(runs):
+    # bars per bucket in each run; while these hold, a longer series only changes its last bucket and adds new ones
+    return [int(bucket_size(*run)) for run in runs]
+
+
+def within_budget(runs):
+    return all(stop - start <= budget for start, stop, budget in runs)
+
+
+def downsample_ohlc(df, runs):
+    # merges consecutive bars into OHLC buckets, each labelled with the time of its first bar
+    if within_budget(runs):
+        return df
+    starts = np.concatenate([bucket_starts(*run) for run in runs])
+    stops = np.append(starts[1:], len(df))
+    out = {}
+    for name in df.columns:
+        values = np.asarray(df[name].values, dtype='f8')
+        if name == 'Open':
+            out[name] = values[starts]
+        elif name == 'Close':
+            out[name] = values[stops - 1]
+        elif name == 'High':
+            out[name] = np.maximum.reduceat(values, starts)
+        elif name == 'Low':
+            out[name] = np.minimum.reduceat(values, starts)
+        else:
+            out[name] = np.add.reduceat(values, starts)
+    return pd.DataFrame(out, index=df.index[starts], columns=df.columns)
+
+
+def lttb(y, start, stop, budget):
+    # largest-triangle-three-buckets over the finite values of y[start:stop], x being the bar position;
+    # returns the kept positions, always including the first and last finite point
+    x = np.arange(start, stop)
+    if stop - start <= budget:
+        return x
+    y = np.asarray(y[start:stop], dtype='f8')
+    finite = np.isfinite(y)
+    x, y = x[finite], y[finite]
+    n = len(x)
+    if n <= budget or budget < 3:
+        return x
+    edges = np.linspace(1, n - 1, budget - 1).astype(int)
+    sum_x = np.concatenate([[0], np.cumsum(x)])
+    sum_y = np.concatenate([[0.0], np.cumsum(y)])
+    mean_x = (sum_x[edges[1:]] - sum_x[edges[:-1]]) / np.diff(edges)
+    mean_y = (sum_y[edges[1:]] - sum_y[edges[:-1]]) / np.diff(edges)
+    keep = np.empty(budget, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(budget - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # the next bucket's centroid stands in for the point still to be chosen there
+        if i + 1 < budget - 2:
+            cx, cy = mean_x[i + 1], mean_y[i + 1]
+        else:
+            cx, cy = x[-1], y[-1]
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return x[keep]
+
+
+def line_positions(y, runs):
+    return np.concatenate([lttb(y, start, stop, budget * PIXELS_PER_CANDLE // PIXELS_PER_POINT)
+                           for start, stop, budget in runs])
+
+
+def candle_budget(plot_width):
+    return max(1, plot_width // PIXELS_PER_CANDLE)
@@ -0,0 +1,220 @@
+import bisect
+import functools
+import json
+
+import numpy as np
+import flask
+import pandas as pd
+from dash import callback_context, no_update
+from dash.exceptions import PreventUpdate
+
+from data_cache import TTLCache
+from metrics import timed
+
+# layout shared by every chart; validated by plotly once per size in layout_template()
+CHART_LAYOUT = {
+    'xaxis_title': 'Time',
+    'xaxis': {
+        'showspikes': True,
+        'spikemode': 'across',
+        'spikesnap': 'cursor',
+        'spikecolor': 'black',
+        'spikethickness': 1
+    },
+    'yaxis': {
+        'showspikes': True,
+        'spikemode': 'across',
+        'spikesnap': 'cursor',
+        'spikecolor': 'black',
+        'spikethickness': 1,
+        'side': 'right'
+    },
+    'dragmode': 'pan',
+    'hovermode': 'x',
+    'xaxis_rangeslider_visible': False,
+    'modebar': {
+        'orientation': 'v'},
+    'spikedistance': -1, 'hoverdistance': 100,
+    'template': 'plotly_white',
+    'legend': {
+        'orientation': 'h'
+    },
+    'margin': {
+        'l': 80, 'r': 80, 't': 20, 'b': 80
+    },
+}
+
+INTRADAY = ('60m', '30m', '15m', '5m', '2m', '1m')
+
+# bars resent with every delta, enough for indicators that revise earlier points (the chikou span lags 26 bars)
+DELTA_OVERLAP = 32
+SERIES_FIELDS = ('x', 'y', 'open', 'high', 'low', 'close', 'text')
+
+
+@functools.lru_cache(maxsize=None)
+def layout_template(width, height):
+    import plotly.graph_objects as go
+    return go.Layout(dict(CHART_LAYOUT, width=width, height=height)).to_plotly_json()
+
+
+def layout(width, height, uirevision, period, interval):
+    # shallow copy of the validated template; only the keys changed here are replaced, never mutated
+    out = dict(layout_template(width, height), uirevision=uirevision)
+    if period != '1d':
+        if interval == '1d':
+            out['xaxis'] = dict(out['xaxis'], rangebreaks=[dict(bounds=["sat", "mon"])])
+        elif interval in INTRADAY:
+            out['xaxis'] = dict(out['xaxis'], rangebreaks=[dict(bounds=["sat", "mon"]),
+                                                           dict(bounds=[15.5, 9], pattern='hour')])
+    return out
+
+
+def plot_width(width):
+    return width - CHART_LAYOUT['margin']['l'] - CHART_LAYOUT['margin']['r']
+
+
+def json_values(values):
+    values = np.asarray(values, dtype='f8')
+    missing = np.isnan(values)
+    if not missing.any():
+        return values.tolist()
+    out = values.astype(object)
+    out[missing] = None
+    return out.tolist()
+
+
+def json_dates(index):
+    # exchange wall-clock times; plotly.js ignores any utc offset on date strings anyway
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return np.datetime_as_string(index.values, unit='s').tolist()
+
+
+def candlestick(df, name, x=None):
+    return {
+        'type': 'candlestick',
+        'open': json_values(df['Open'].values),
+        'high': json_values(df['High'].values),
+        'low': json_values(df['Low'].values),
+        'close': json_values(df['Close'].values),
+        'x': json_dates(df.index) if x is None else x,
+        'name': name,
+        'hoverinfo': 'x'
+    }
+
+
+def trace_nbytes(traces):
+    # rough serialized size: a date string or number is about 20 bytes
+    if isinstance(traces, dict):
+        traces = [traces]
+    return sum(20 * len(trace[f]) for trace in traces for f in SERIES_FIELDS if f in trace) + 256 * len(traces)
+
+
+def _default(obj):
+    if isinstance(obj, np.ndarray):
+        return json_values(obj) if obj.dtype.kind == 'f' else obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, pd.DatetimeIndex):
+        return json_dates(obj)
+    if isinstance(obj, pd.Timestamp):
+        return obj.isoformat()
+    raise TypeError('%r is not JSON serializable' % type(obj))
+
+
+def encode(obj):
+    return json.dumps(obj, separators=(',', ':'), allow_nan=False, default=_default)
+
+
+def encode_response(outputs_list, values):
+    # the body Dash's own callback wrapper would send, minus plotly's validate/encode/decode/encode pass
+    if not isinstance(outputs_list, list):
+        outputs_list, values = [outputs_list], [values]
+    response = {}
+    for spec, value in zip(outputs_list, values):
+        if value is not no_update:
+            response.setdefault(spec['id'], {})[spec['property']] = value
+    if not response:
+        raise PreventUpdate
+    return encode({'response': response, 'multi': True})
+
+
+def figure_callback(app, cache, *args, **kwargs):
+    """Registers a Dash callback whose figures are built as plain dicts and cached as serialized responses.
+
+    Takes the same arguments as app.callback. The decorated function returns ``(key, build)``; ``build()``
+    returns the output value(s), with ``dash.no_update`` for outputs to leave alone. The encoded response is
+    cached under ``key``, so an unchanged chart is served without being rebuilt or re-serialized. The body is
+    handed to Flask as the finished response, which skips Dash's validate-and-encode pass over the figures.
+    """
+    def register(func):
+        @functools.wraps(func)
+        def respond(*values):
+            key, build = func(*values)
+            body = cache.get(key)
+            if body is None:
+                with timed('figure'):
+                    outputs = build()
+                with timed('serialize'):
+                    body = cache.put(key, encode_response(callback_context.outputs_list, outputs))
+            flask.abort(flask.Response(body, mimetype='application/json'))
+
+        app.callback(*args, **kwargs)(respond)
+        return func
+    return register
+
+
+def figure_state(figure, key, buckets=None):
+    # what the browser holds after applying an update: the chart identity, its first and last candle and the
+    # bars per candle it was bucketed with
+    x = figure['data'][0]['x'] if figure['data'] else []
+    if not x:
+        return None
+    return {'key': key, 'first': x[0], 'last': x[-1], 'buckets': buckets}
+
+
+def delta_base(state, key, buckets=None):
+    # the (first, last) candles a delta can be computed against, or None when the chart must be sent whole
+    if not state or state.get('key') != key or state.get('buckets') != buckets:
+        return None
+    return state['first'], state['last']
+
+
+def figure_delta(figure, base):
+    x = figure['data'][0]['x'] if figure['data'] else []
+    first, last = base
+    pos = bisect.bisect_left(x, last)
+    if not x or x[0] != first or pos == len(x) or x[pos] != last:
+        # bars dropped off the front or the browser's last bar is gone; only a full figure is safe
+        return None
+    traces = []
+    for i, trace in enumerate(figure['data']):
+        if trace.get('fill') == 'toself':
+            # closed shapes aren't ordered by x, so they are resent whole
+            traces.append({'index': i, 'trace': trace})
+            continue
+        start = max(0, bisect.bisect_left(trace['x'], last) - DELTA_OVERLAP)
+        update = {f: trace[f][start:] for f in SERIES_FIELDS if f in trace}
+        update['index'] = i
+        traces.append(update)
+    return {'traces': traces}
+
+
+def figure_update(figure, key, base=None, buckets=None):
+    """Returns ``(update, state)`` for a graph written by the clientside ``charts.apply`` callback.
+
+    With a ``base`` from ``delta_base()`` the update carries only the tail of every trace, from a few bars
+    before the browser's last candle; the browser trims each trace where its tail starts and appends it.
+    Otherwise it carries the whole figure. ``buckets`` are the bucket sizes the figure was downsampled with,
+    kept in the state so a delta is only offered against candles bucketed the same way.
+    """
+    if figure is no_update:
+        return no_update, no_update
+    delta = figure_delta(figure, base) if base else None
+    if delta is None:
+        return {'figure': figure}, figure_state(figure, key, buckets)
+    return {'delta': delta}, figure_state(figure, key, buckets)
+
+
+def response_cache(max_bytes=64 * 1024 * 1024):
+    return TTLCache(max_bytes=max_bytes, sizeof=len)
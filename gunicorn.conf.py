@@ -0,0 +1,31 @@
+import gc
+import os
+import time
+
+import startup
+
+# the app module (yfinance and plotly.graph_objects still load lazily), the symbol index and the layout are
+# built once in the master; forked workers share those pages copy-on-write and boot in milliseconds
+preload_app = True
+# /stream holds a connection open per watching browser, so requests are served by threads, not whole processes;
+# main.STREAM_LIMIT (half the threads by default) caps the streams so callbacks are never starved of threads
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+
+
+def when_ready(server):
+    import main
+    main.warm_start()
+    startup.log('master startup')
+    # keep the cyclic collector from touching, and so copying, the preloaded objects in every worker
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    worker.forked_at = time.perf_counter()
+
+
+def post_worker_init(worker):
+    import main
+    main.start_prefetch()
+    worker.log.info('worker %s booted in %.4fs', worker.pid, time.perf_counter() - worker.forked_at)
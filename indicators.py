@@ -0,0 +1,170 @@
+import hashlib
+import threading
+
+import numpy as np
+import pandas as pd
+import talib
+
+from data_cache import TTLCache
+from streaming import STREAMS, sync
+
+# name -> (function, dependency resolver, default params)
+REGISTRY = {}
+
+
+def indicator(name, deps=None, **defaults):
+    # deps(**params) returns the (name, params) sub-results the function takes after the frame
+    def register(func):
+        REGISTRY[name] = (func, deps, defaults)
+        return func
+    return register
+
+
+def column(df, name):
+    return np.ascontiguousarray(df[name].values, dtype='f8')
+
+
+def shift(values, n):
+    out = np.full(len(values), np.nan)
+    if n >= 0:
+        out[n:] = values[:len(values) - n]
+    else:
+        out[:n] = values[-n:]
+    return out
+
+
+# rows a fingerprint samples, spread evenly from the first to the last
+FINGERPRINT_ROWS = 16
+
+
+def fingerprint(df):
+    # O(1) in the length of the series: its length and an even sample of rows, both ends included. A new or
+    # revised tail bar changes the last row, revised history (an adjustment, a re-download) the first
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.int64(len(df)).tobytes())
+    rows = np.unique(np.linspace(0, len(df) - 1, FINGERPRINT_ROWS).astype(int)) if len(df) else []
+    h.update(np.ascontiguousarray(df.index.asi8[rows]).view('u1'))
+    for name in ('Open', 'High', 'Low', 'Close'):
+        h.update(np.ascontiguousarray(column(df, name)[rows]).view('u1'))
+    return h.hexdigest()
+
+
+def result_nbytes(result):
+    if isinstance(result, tuple):
+        return sum(r.nbytes for r in result)
+    return result.nbytes
+
+
+@indicator('ma', timeperiod=20)
+def moving_average(df, timeperiod):
+    return talib.MA(column(df, 'Close'), timeperiod=timeperiod, matype=0)
+
+
+@indicator('ema', timeperiod=9)
+def exponential_moving_average(df, timeperiod):
+    return talib.EMA(column(df, 'Close'), timeperiod=timeperiod)
+
+
+@indicator('bbands', timeperiod=20, nbdev=2)
+def bollinger_bands(df, timeperiod, nbdev):
+    return talib.BBANDS(column(df, 'Close'), timeperiod=timeperiod, nbdevup=nbdev, nbdevdn=nbdev, matype=0)
+
+
+@indicator('sar', acceleration=0.02, maximum=0.2)
+def parabolic_sar(df, acceleration, maximum):
+    # the chart has always fed closes in as the lows
+    return talib.SAR(column(df, 'High'), column(df, 'Close'), acceleration=acceleration, maximum=maximum)
+
+
+@indicator('rolling_high', window=9)
+def rolling_high(df, window):
+    return pd.Series(column(df, 'High')).rolling(window=window).max().values
+
+
+@indicator('rolling_low', window=9)
+def rolling_low(df, window):
+    return pd.Series(column(df, 'Low')).rolling(window=window).min().values
+
+
+@indicator('midpoint', deps=lambda window: [('rolling_high', {'window': window}), ('rolling_low', {'window': window})],
+           window=9)
+def midpoint(df, high, low, window):
+    return (high + low) / 2
+
+
+@indicator('senkou_a', deps=lambda tenkan, kijun, displacement: [('midpoint', {'window': tenkan}),
+                                                                  ('midpoint', {'window': kijun})],
+           tenkan=9, kijun=26, displacement=26)
+def senkou_span_a(df, tenkan_sen, kijun_sen, tenkan, kijun, displacement):
+    return shift((tenkan_sen + kijun_sen) / 2, displacement)
+
+
+@indicator('senkou_b', deps=lambda window, displacement: [('midpoint', {'window': window})], window=52, displacement=26)
+def senkou_span_b(df, mid, window, displacement):
+    return shift(mid, displacement)
+
+
+@indicator('chikou', displacement=26)
+def chikou_span(df, displacement):
+    return shift(column(df, 'Close'), -displacement)
+
+
+@indicator('engulfing')
+def engulfing(df):
+    return talib.CDLENGULFING(column(df, 'Open'), column(df, 'High'), column(df, 'Low'), column(df, 'Close'))
+
+
+class IndicatorEngine:
+    """Computes registered indicators on demand, memoized per (series fingerprint, indicator, params).
+
+    Dependencies are resolved through the same cache, so sub-results shared between indicators (such as
+    the Ichimoku rolling highs and lows) are computed once per series. When bound with a series key, the
+    indicators in streaming.STREAMS keep running state per key and only process the bars that changed
+    since the series was last seen.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.cache = TTLCache(max_bytes=max_bytes, sizeof=result_nbytes)
+        self.streams = TTLCache(max_bytes=max_bytes, sizeof=lambda stream: stream.nbytes())
+        self._streams_lock = threading.Lock()
+
+    def bind(self, df, key=None, fp=None):
+        return BoundIndicators(self, df, fingerprint(df) if fp is None else fp, key)
+
+    def compute(self, df, fp, name, params, key=None):
+        func, deps, defaults = REGISTRY[name]
+        params = dict(defaults, **params)
+        cache_key = (fp, name, tuple(sorted(params.items())))
+        result = self.cache.get(cache_key)
+        if result is None:
+            if key is not None and name in STREAMS and len(df):
+                result = self._stream(df, key, name, params)
+            else:
+                inputs = [self.compute(df, fp, dep, dep_params, key)
+                          for dep, dep_params in (deps(**params) if deps else [])]
+                result = func(df, *inputs, **params)
+            self.cache.put(cache_key, result)
+        return result
+
+    def _stream(self, df, key, name, params):
+        stream_key = (key, name, tuple(sorted(params.items())))
+        with self._streams_lock:
+            stream = self.streams.get(stream_key)
+            if stream is None:
+                stream = self.streams.put(stream_key, STREAMS[name](**params))
+        with stream.lock:
+            result = sync(stream, df)
+        self.streams.put(stream_key, stream)
+        return result
+
+
+class BoundIndicators:
+
+    def __init__(self, engine, df, fp, key=None):
+        self.engine = engine
+        self.df = df
+        self.fingerprint = fp
+        self.key = key
+
+    def get(self, name, **params):
+        return self.engine.compute(self.df, self.fingerprint, name, params, self.key)
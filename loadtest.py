@@ -0,0 +1,297 @@
+import collections
+import functools
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pandas as pd
+
+from benchmark import END, INDICATORS, callback_body, git_commit
+from panel import NORMALIZATIONS
+
+GRAPH = '..graph-update.data...graph-state.data..'
+TAB2 = '..tab2-graph-A-update.data...tab2-graph-B-update.data...tab2-graph-C-update.data...tab2-graph-state.data..'
+HOVER = '..displayhover.children...displayhover.style..'
+SEARCH = 'tickinput.options'
+# relative weights of what a session does between its interval ticks
+ACTIONS = {'new_symbol': 3, 'toggle_indicator': 4, 'add_compare': 2, 'switch_norm': 1, 'tab2_symbol': 1, 'hover': 10}
+MAX_COMPARE = 2
+
+
+class ClientTransport:
+    """Requests served in this process by the Flask test client, like one gthread worker with a thread per session."""
+
+    def __init__(self, server):
+        self.client = server.test_client()
+
+    def get(self, path):
+        response = self.client.get(path)
+        return response.status_code, response.data
+
+    def post(self, path, body):
+        response = self.client.post(path, json=body)
+        return response.status_code, response.data
+
+
+class HttpTransport:
+    """Requests sent over HTTP to a running deployment."""
+
+    def __init__(self, url, timeout=60):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def _send(self, request):
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def get(self, path):
+        return self._send(urllib.request.Request(self.url + path))
+
+    def post(self, path, body):
+        return self._send(urllib.request.Request(self.url + path, data=json.dumps(body).encode(), method='POST',
+                                                 headers={'Content-Type': 'application/json'}))
+
+
+class Recorder:
+
+    def __init__(self):
+        self.latencies = collections.defaultdict(list)
+        self.errors = collections.Counter()
+        self.bytes = collections.Counter()
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds, ok, size):
+        with self._lock:
+            self.latencies[name].append(seconds)
+            self.bytes[name] += size
+            if not ok:
+                self.errors[name] += 1
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def layout_props(node, found=None):
+    # {component id: props} for every component in a /_dash-layout tree
+    found = {} if found is None else found
+    if isinstance(node, list):
+        for child in node:
+            layout_props(child, found)
+    elif isinstance(node, dict) and 'props' in node:
+        if 'id' in node['props']:
+            found[node['props']['id']] = node['props']
+        layout_props(node['props'].get('children'), found)
+    return found
+
+
+class Session:
+    """One browser tab: loads the page, draws both tabs, then works with the main chart.
+
+    Every ``tick`` seconds it fires the interval refresh of both tabs; in between it waits an exponentially
+    distributed think time and then changes symbol, toggles an indicator, adds or clears a compare symbol,
+    switches the compare normalization or the tab2 symbol, or hovers over a candle.
+    """
+
+    def __init__(self, transport, recorder, tickers, rng, think, tick):
+        self.transport = transport
+        self.recorder = recorder
+        self.tickers = tickers
+        self.rng = rng
+        self.think = think
+        self.tick_every = tick
+
+    def request(self, name, method, path, body=None):
+        started = time.perf_counter()
+        try:
+            status, data = self.transport.post(path, body) if method == 'POST' else self.transport.get(path)
+        except OSError:
+            status, data = None, b''
+        self.recorder.record(name, time.perf_counter() - started, status in (200, 204), len(data))
+        return status, data
+
+    def call(self, name, output, inputs, state=(), changed=None):
+        body = callback_body(self.specs[output], output, inputs, state, changed)
+        status, data = self.request(name, 'POST', '/_dash-update-component', body)
+        return json.loads(data)['response'] if status == 200 else None
+
+    def open(self):
+        self.request('index', 'GET', '/')
+        props = layout_props(json.loads(self.request('layout', 'GET', '/_dash-layout')[1]))
+        deps = json.loads(self.request('dependencies', 'GET', '/_dash-dependencies')[1])
+        self.specs = {d['output']: d for d in deps}
+        self.tick, self.period = props['tickinput']['value'], props['periodinput']['value']
+        self.interval = props['intervalinput']['value']
+        self.norm = props['compare-norm']['value']
+        self.indicators, self.compare, self.n, self.graph_state, self.xs = [], [], 0, None, []
+        self.tab2_tick = props['tab2_tickinput']['value']
+        self.tab2_specs = [v for p in 'ABC' for v in (props['tab2-periodinput-%s' % p]['value'],
+                                                      props['tab2-intervalinput-%s' % p]['value'])]
+        self.tab2_n, self.tab2_state = 0, None
+        self.chart('tickinput.value')
+        self.tab2()
+
+    def chart(self, changed):
+        response = self.call('callback1', GRAPH, [self.tick, self.period, self.interval, self.n, self.indicators,
+                                                  self.compare, None, self.norm], [self.graph_state], [changed])
+        if response is None:
+            return
+        update = response['graph-update']['data']
+        self.graph_state = response['graph-state']['data']
+        trace = update['figure']['data'][0] if 'figure' in update else update['delta']['traces'][0]
+        self.xs = trace.get('x') or self.xs
+
+    def tab2(self, changed='tab2_tickinput.value'):
+        response = self.call('tab2_callback', TAB2, [self.tab2_tick] + self.tab2_specs + [self.tab2_n],
+                             [self.tab2_state], [changed])
+        if response is not None:
+            self.tab2_state = response['tab2-graph-state']['data']
+
+    def new_symbol(self):
+        tick = self.rng.choice(self.tickers)
+        self.call('symbol_options', SEARCH, [tick[:3]], [self.tick], ['tickinput.search_value'])
+        self.tick, self.graph_state = tick, None
+        self.chart('tickinput.value')
+
+    def toggle_indicator(self):
+        ind = self.rng.choice(INDICATORS)
+        self.indicators = [i for i in self.indicators if i != ind] if ind in self.indicators \
+            else self.indicators + [ind]
+        self.chart('indicator_sel.value')
+
+    def add_compare(self):
+        self.compare = [] if len(self.compare) >= MAX_COMPARE else self.compare + [self.rng.choice(self.tickers)]
+        self.chart('compare.value')
+
+    def switch_norm(self):
+        self.norm = self.rng.choice([n for n in NORMALIZATIONS if n != self.norm])
+        self.chart('compare-norm.value')
+
+    def tab2_symbol(self):
+        self.tab2_tick = self.rng.choice(self.tickers)
+        self.tab2()
+
+    def hover(self):
+        if self.xs:
+            x = pd.Timestamp(self.rng.choice(self.xs)).strftime('%Y-%m-%d %H:%M')
+            self.call('display_hover_data', HOVER, [{'points': [{'x': x}]}],
+                      [self.tick, self.period, self.interval, self.compare, None, self.norm], ['graph.hoverData'])
+
+    def interval_tick(self):
+        self.n += 1
+        self.tab2_n += 1
+        self.chart('interval-component.n_intervals')
+        self.tab2('tab2-interval-component.n_intervals')
+
+    def run(self, until):
+        self.open()
+        names, weights = zip(*ACTIONS.items())
+        next_tick = time.monotonic() + self.tick_every
+        while True:
+            now = time.monotonic()
+            wake = min(now + self.rng.expovariate(1 / self.think), next_tick)
+            if wake >= until:
+                break
+            time.sleep(max(0.0, wake - now))
+            if wake >= next_tick:
+                self.interval_tick()
+                next_tick += self.tick_every
+            else:
+                getattr(self, self.rng.choices(names, weights)[0])()
+
+
+def run(sessions=10, duration=60, url=None, think=1.0, tick=30, ramp=5, seed=0):
+    # an in-process run keeps its bar store in a temporary directory, removed when the run is over
+    with tempfile.TemporaryDirectory(prefix='loadtest-bars-') as bars:
+        return simulate(sessions, duration, url, think, tick, ramp, seed, bars)
+
+
+def simulate(sessions, duration, url, think, tick, ramp, seed, bars):
+    if url is None:
+        os.environ['MARKET_DATA_PROVIDER'] = 'local'
+        os.environ.setdefault('MARKET_DATA_END', END)
+        os.environ['BAR_STORE_DIR'] = bars
+        os.environ.pop('BAR_STORE_OFFLINE', None)
+        import main
+        tickers = main.symbols.tickers
+        transport = functools.partial(ClientTransport, main.server)
+    else:
+        tickers = pd.read_csv(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stocksymbols.csv'),
+                              encoding='latin-1')['Ticker'].tolist()
+        transport = functools.partial(HttpTransport, url)
+
+    recorder = Recorder()
+    rng = random.Random(seed)
+    started = time.monotonic()
+    until = started + ramp + duration
+    threads = []
+    for i in range(sessions):
+        session = Session(transport(), recorder, tickers, random.Random(rng.random()), think, tick)
+        threads.append(threading.Timer(ramp * i / sessions, session.run, (until,)))
+        threads[-1].start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    results = {}
+    for name, times in sorted(recorder.latencies.items()):
+        ordered = sorted(times)
+        results[name] = {
+            'requests': len(ordered),
+            'errors': recorder.errors[name],
+            'per_second': round(len(ordered) / elapsed, 3),
+            'p50_ms': round(1000 * percentile(ordered, 0.50), 3),
+            'p95_ms': round(1000 * percentile(ordered, 0.95), 3),
+            'p99_ms': round(1000 * percentile(ordered, 0.99), 3),
+            'max_ms': round(1000 * ordered[-1], 3),
+            'mean_bytes': recorder.bytes[name] // len(ordered),
+        }
+    total = sum(r['requests'] for r in results.values())
+    return {
+        'meta': {'commit': git_commit(), 'target': url or 'in-process', 'sessions': sessions, 'duration': duration,
+                 'think': think, 'tick': tick, 'seed': seed, 'elapsed': round(elapsed, 3),
+                 'requests': total, 'per_second': round(total / elapsed, 3),
+                 'errors': sum(r['errors'] for r in results.values())},
+        'results': results,
+    }
+
+
+def print_report(report):
+    meta = report['meta']
+    print('%(sessions)d sessions against %(target)s for %(elapsed).1fs: %(requests)d requests, '
+          '%(per_second).1f/s, %(errors)d errors' % meta)
+    print('%-20s %8s %7s %8s %10s %10s %10s %10s' % ('callback', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms',
+                                                   'p99 ms', 'max ms'))
+    for name, r in report['results'].items():
+        print('%-20s %8d %7d %8.2f %10.1f %10.1f %10.1f %10.1f' % (name, r['requests'], r['errors'], r['per_second'],
+                                                                   r['p50_ms'], r['p95_ms'], r['p99_ms'],
+                                                                   r['max_ms']))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Simulate concurrent Dash sessions and report latency per callback.')
+    parser.add_argument('--sessions', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=60, help='seconds to run after the ramp-up')
+    parser.add_argument('--url', help='a running deployment (default: main:server in-process on synthetic bars)')
+    parser.add_argument('--think', type=float, default=1.0, help='mean seconds between a session\'s actions')
+    parser.add_argument('--tick', type=float, default=30, help='seconds between interval refreshes')
+    parser.add_argument('--ramp', type=float, default=5, help='seconds over which sessions start')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='also write the report as JSON here')
+    args = parser.parse_args()
+    report = run(args.sessions, args.duration, args.url, args.think, args.tick, args.ramp, args.seed)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    sys.exit(1 if report['meta']['errors'] else 0)
@@ -1,37 +1,279 @@
-import yfinance as yf
+import startup
+import datetime
+import json
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import numpy as np
 import pandas as pd
-import plotly.graph_objects as go
+import flask
 import dash
+from dash import no_update
 import dash_core_components as dcc
 import dash_html_components as html
 import dash_bootstrap_components as dbc
-from dash.dependencies import Input, Output
-import talib
+from dash.dependencies import ClientsideFunction, Input, Output, State
+from dash.exceptions import PreventUpdate
+from bar_store import BarStore
+from data_cache import TTLCache, interval_ttl, trim_period
+from downsample import bucket_sizes, candle_budget, downsample_ohlc, line_positions, segments, viewport, visible
+from figures import (candlestick, delta_base, encode, figure_callback, figure_update, json_dates, json_values,
+                     layout, layout_template, plot_width, response_cache, trace_nbytes)
+from indicators import IndicatorEngine, fingerprint
+from market_hours import now, refresh_delay
+from panel import NORMALIZATIONS, Panel, normalize
+import metrics
+from metrics import timed
+from prefetch import Prefetcher
+import profiling
+from push import Hub
+from providers import get_provider
+from resample import derive_frame, plan_frames
+from singleflight import SingleFlight
+from symbols import SymbolIndex
 
-app = dash.Dash(external_stylesheets=[dbc.themes.CERULEAN], title='Stock Market View', update_title='Loading...')
+startup.mark('imports')
+
+app = dash.Dash(__name__, external_stylesheets=[dbc.themes.CERULEAN], title='Stock Market View', update_title='Loading...')
 
 server = app.server
 
 
-def load_ticks():
-    options = []
-    optdf = pd.read_csv('ticksymbols.csv', encoding='latin-1')
-    optdf.set_index('Ticker', inplace=True)
+symbols = SymbolIndex.from_csv('stocksymbols.csv')
+startup.mark('symbols')
+
+
+# upstream downloads for one callback run side by side; each is abandoned after FETCH_TIMEOUT seconds
+FETCH_WORKERS = 8
+FETCH_TIMEOUT = 15
+fetch_pool = ThreadPoolExecutor(max_workers=FETCH_WORKERS)
+
+provider = get_provider(timeout=FETCH_TIMEOUT)
+ohlcv_cache = TTLCache(ttl=lambda key: interval_ttl(key[2]))
+bar_store = BarStore(os.environ.get('BAR_STORE_DIR', 'bar_store'),
+                     offline=os.environ.get('BAR_STORE_OFFLINE', '').lower() in ('1', 'true', 'yes'))
+
+
+# the last frame fetched for each series, kept past its freshness so a redraw can reuse what is on screen
+latest_frames = TTLCache()
+
+
+# concurrent misses for the same series share one download and parse
+fetch_flights = SingleFlight()
+# requests per series, halved on every prefetch pass, which ranks the hot views the prefetcher keeps warm
+fetch_usage = Counter()
+usage_lock = threading.Lock()
+# when each series was last loaded, so the prefetcher can tell whether new bars can exist since
+series_loaded = TTLCache(max_bytes=1024 * 1024, sizeof=lambda loaded: 64)
+
+
+def cache_series(period, interval, tick, df):
+    key = (tick, period, interval)
+    df = trim_period(df, period)
+    ohlcv_cache.put(key, df)
+    latest_frames.put(key, df)
+    series_loaded.put(key, now())
+    return df
+
+
+def load_series(period, interval, tick):
+    history = metrics.counted(type(provider).__name__, provider.history)
+    return cache_series(period, interval, tick, bar_store.load(tick, period, interval, history))
+
+
+def load_group(period, interval, ticks):
+    # several symbols over one range: what the bar store misses comes down in one provider.history_many call
+    history_many = metrics.counted(type(provider).__name__, provider.history_many)
+    loaded = bar_store.load_many(ticks, period, interval, history_many)
+    return {tick: cache_series(period, interval, tick, df) for tick, df in loaded.items()}
+
+
+def fresh_data(period, interval, tick):
+    # the series if the cache still holds it fresh, counted as a use of it; None when it has to be loaded
+    key = (tick, period, interval)
+    with usage_lock:
+        fetch_usage[key] += 1
+    return ohlcv_cache.get(key)
+
+
+def missing_data(period, interval, tick):
+    return fetch_flights.do((tick, period, interval), lambda: load_series(period, interval, tick),
+                            timeout=FETCH_TIMEOUT)
+
+
+def fetch_data(period, interval, tick):
+    df = fresh_data(period, interval, tick)
+    return missing_data(period, interval, tick) if df is None else df
+
+
+def current_cached(period, interval, tick):
+    df = latest_frames.get((tick, period, interval))
+    return fresh_data(period, interval, tick) if df is None else df
+
 
-    for index, row in optdf.iterrows():
-        optdict = {'label': str(row['Name']) + '-\t' + str(index), 'value': index}
-        options.append(optdict)
-    return options
+def missing_group(period, interval, ticks):
+    if len(ticks) == 1:
+        return {ticks[0]: missing_data(period, interval, ticks[0])}
+    return fetch_flights.do((tuple(ticks), period, interval), lambda: load_group(period, interval, ticks),
+                            timeout=FETCH_TIMEOUT)
 
 
-def load_data(period, interval, tick, compare=None):
-    ticker = yf.Ticker(tick)
-    df = ticker.history(period=period, interval=interval)
-    df = df.dropna()
+def fetch_many(requests, timeout=FETCH_TIMEOUT, cached=fresh_data):
+    # requests are (period, interval, tick) triples; cache hits are served inline and the misses are downloaded
+    # side by side, one batch per period and interval. A series that fails or misses the deadline comes back as None
+    with timed('fetch'):
+        frames = [cached(*r) for r in requests]
+        groups = {}
+        for i, (period, interval, tick) in enumerate(requests):
+            if frames[i] is None:
+                groups.setdefault((period, interval), []).append(i)
+        futures = {fetch_pool.submit(missing_group, period, interval, sorted({requests[i][2] for i in positions})):
+                   positions for (period, interval), positions in groups.items()}
+        deadline = time.monotonic() + timeout
+        for future, positions in futures.items():
+            names = ', '.join(sorted({'%s %s %s' % requests[i][::-1] for i in positions}))
+            try:
+                loaded = future.result(timeout=max(0, deadline - time.monotonic()))
+            except FutureTimeout:
+                future.cancel()
+                server.logger.warning('fetch of %s timed out after %ss', names, timeout)
+                continue
+            except Exception:
+                server.logger.exception('fetch of %s failed', names)
+                continue
+            for i in positions:
+                frames[i] = loaded.get(requests[i][2])
+                if frames[i] is None:
+                    server.logger.warning('fetch of %s %s %s returned no bars', *requests[i][::-1])
+    return frames
+
+
+# the frame behind each rendered main chart, keyed by its inputs, so hover readouts never see another user's data
+chart_frames = TTLCache(max_bytes=64 * 1024 * 1024)
+
+
+def chart_key(tick, period, interval, compare, norm=None):
+    # the normalization only changes the chart when there is something to compare against
+    return tick, period, interval, tuple(compare or []), norm if compare else None
+
+
+def view_runs(df, window, width=1500):
+    # bars are bucketed to what the plot area can show, at full budget inside the zoomed window
+    return segments(len(df), *visible(df.index, window), candle_budget(plot_width(width)))
+
+
+def chart_view(df, window, width=1500):
+    runs = view_runs(df, window, width)
+    return runs, downsample_ohlc(df, runs)
+
+
+def line_points(index, y, runs):
+    positions = line_positions(y, runs)
+    return json_dates(index[positions]), json_values(y[positions])
+
+
+def ohlc_at(df, x):
+    ts = pd.Timestamp(x)
+    if df.index.tz is not None and ts.tz is None:
+        ts = ts.tz_localize(df.index.tz)
+    pos = df.index.searchsorted(ts)
+    if pos == len(df) or df.index[pos] != ts:
+        return None
+    row = df.iloc[pos]
+    return row['Open'], row['High'], row['Low'], row['Close']
+
+
+PRICES = ['Open', 'High', 'Low', 'Close']
+
+
+def rebase(df, compare=None, norm='offset'):
+    # next to compare symbols the prices are normalized from the first close like theirs; volume is left as is
     if compare is not None and compare != []:
-        return df - df['Close'].iloc[0]
+        out = df.copy()
+        prices = df[PRICES].to_numpy(dtype=float)
+        out[PRICES] = normalize(prices, prices[0, 3], norm)
+        return out
     else:
-        return df
+        return df.copy(deep=False)
+
+
+def load_data(period, interval, tick, compare=None, norm='offset'):
+    return rebase(fetch_data(period, interval, tick), compare, norm)
+
+
+def load_frames(tick, specs):
+    plan = plan_frames(specs)
+    fetched = [spec for spec, source in plan.items() if source is None]
+    frames = dict(zip(fetched, fetch_many([(spec[0], spec[1], tick) for spec in fetched])))
+    for spec, source in plan.items():
+        if source is not None:
+            frames[spec] = None if frames[source] is None else derive_frame(frames[source], spec[0], spec[1])
+    return [frames[spec] for spec in specs]
+
+
+indicator_engine = IndicatorEngine()
+figure_cache = response_cache()
+trace_cache = TTLCache(max_bytes=64 * 1024 * 1024, sizeof=trace_nbytes)
+
+
+def line_style(name, color, **extra):
+    style = {'name': name, 'line': {'width': 1, 'color': color}}
+    style.update(extra)
+    return style
+
+
+# traces drawn for each indicator_sel value: (indicator, params, output field for multi-output indicators, style)
+OVERLAYS = {
+    'mov20': [('ma', {'timeperiod': 20}, None, line_style('MovAvg20', 'fuchsia'))],
+    'mov50': [('ma', {'timeperiod': 50}, None, line_style('MovAvg50', 'red'))],
+    'mov100': [('ma', {'timeperiod': 100}, None, line_style('MovAvg100', 'green'))],
+    'mov200': [('ma', {'timeperiod': 200}, None, line_style('MovAvg200', 'yellow'))],
+    'bbands': [('bbands', {}, 2, line_style('BBlow', 'green')),
+               ('bbands', {}, 0, line_style('BBup', 'green', fill='tonexty', fillcolor='rgba(173,204,255,0.2)')),
+               ('bbands', {}, 1, line_style('BBmid', 'brown'))],
+    'ema': [('ema', {'timeperiod': 9}, None, line_style('EMA', 'purple'))],
+    'sar': [('sar', {}, None, {'name': 'SAR', 'mode': 'markers', 'marker': {'size': 3, 'color': 'orange'}})],
+    'ichi': [('midpoint', {'window': 9}, None, line_style('tenkan_sen', 'cyan')),
+             ('midpoint', {'window': 26}, None, line_style('kijun_sen', 'maroon')),
+             ('senkou_a', {}, None, line_style('senkou_span_a', 'green')),
+             ('senkou_b', {}, None, line_style('senkou_span_b', 'red', fill='tonexty',
+                                               fillcolor='rgba(173,204,255,0.2)')),
+             ('chikou', {}, None, line_style('chikou_span', 'green'))],
+}
+
+
+def engulfing_trace(df, pattern, signal, color, name):
+    # every signal bar is boxed from the last non-signal bar before it, as one filled scatter trace with a
+    # None-separated polygon per occurrence rather than a layout shape and annotation each
+    match = pattern == signal
+    last_miss = np.maximum.accumulate(np.where(match, -1, np.arange(len(match))))
+    hits = np.flatnonzero(match & (last_miss >= 0))
+    x0 = np.array(json_dates(df.index[last_miss[hits]]), dtype=object)
+    x1 = np.array(json_dates(df.index[hits]), dtype=object)
+    low = np.full(len(hits), float(df['Low'].min()), dtype=object)
+    high = np.full(len(hits), float(df['High'].max()), dtype=object)
+    gap = np.full(len(hits), None, dtype=object)
+    x = np.column_stack([x0, x0, x1, x1, x0, gap])
+    y = np.column_stack([low, high, high, low, low, gap])
+    text = np.full(x.shape, '', dtype=object)
+    text[:, 1] = 'BE'
+    return {
+        'x': x.ravel().tolist(),
+        'y': y.ravel().tolist(),
+        'text': text.ravel().tolist(),
+        'type': 'scatter',
+        'mode': 'lines+text',
+        'textposition': 'top right',
+        'fill': 'toself',
+        'fillcolor': color,
+        'line': {
+            'width': 0
+        },
+        'name': name,
+        'hoverinfo': 'skip'
+    }
 
 
 def period_int(p):
@@ -51,18 +293,11 @@ def period_int(p):
         return '1mo'
 
 
-def rangebreak(fig, period, interval):
-    if period != '1d':
-        if interval == '1d':
-            fig.update_xaxes(rangebreaks=[dict(bounds=["sat", "mon"])])
-        elif interval == '60m' or interval == '30m' or interval == '15m' or interval == '5m' or interval == '2m' or interval == '1m':
-            fig.update_xaxes(rangebreaks=[dict(bounds=["sat", "mon"]), dict(bounds=[15.5, 9], pattern='hour')])
-    return fig
-
+startup.mark('setup')
 
 app.layout = html.Div([dcc.Tabs([
     dcc.Tab(label='Single Time Frame', children=[dbc.Row([dbc.Col(dcc.Dropdown(id='tickinput',
-                                                                               options=load_ticks(),
+                                                                               options=[],
                                                                                placeholder='Stock',
                                                                                value='^NSEI',
                                                                                multi=False,
@@ -131,7 +366,7 @@ app.layout = html.Div([dcc.Tabs([
                                                                   width={'size': 1, 'offset': 0},
                                                                   ),
                                                           dbc.Col(dcc.Dropdown(id='compare',
-                                                                               options=load_ticks(),
+                                                                               options=[],
                                                                                placeholder='Compare',
                                                                                multi=True,
                                                                                searchable=True,
@@ -144,6 +379,25 @@ app.layout = html.Div([dcc.Tabs([
                                                                   width={'size': 3, 'offset': 0},
                                                                   style={'display': 'inline-block'},
                                                                   ),
+                                                          dbc.Col(dcc.Dropdown(id='compare-norm',
+                                                                               options=[
+                                                                                   {'label': 'Offset',
+                                                                                    'value': 'offset'},
+                                                                                   {'label': '% Return',
+                                                                                    'value': 'pct'},
+                                                                                   {'label': 'Log Return',
+                                                                                    'value': 'log'}
+                                                                               ],
+                                                                               value='offset',
+                                                                               optionHeight=30,
+                                                                               searchable=False,
+                                                                               clearable=False,
+                                                                               persistence=True,
+                                                                               persistence_type='session',
+                                                                               style={'background-color': '#F0F8FF'}
+                                                                               ),
+                                                                  width={'size': 1, 'offset': 0}
+                                                                  ),
                                                           dbc.Col(dcc.Dropdown(id='indicator_sel',
                                                                                options=[
                                                                                    {'label': 'Bollinger Bands',
@@ -211,6 +465,11 @@ app.layout = html.Div([dcc.Tabs([
                                                      interval=30 * 1000,
                                                      n_intervals=0
                                                  ),
+                                                 dcc.Store(id='viewport'),
+                                                 dcc.Store(id='graph-update'),
+                                                 dcc.Store(id='graph-state'),
+                                                 dcc.Store(id='graph-push'),
+                                                 dcc.Interval(id='stream-check', interval=10 * 1000),
                                                  dbc.Modal([
                                                      dbc.ModalHeader(html.H3("Welcome to Stock Market View!!")),
                                                      dbc.ModalBody(
@@ -225,7 +484,7 @@ app.layout = html.Div([dcc.Tabs([
                             'padding': '6px'}
             ),
     dcc.Tab(label='Multiple Time Frames', children=[dbc.Row(dbc.Col(dcc.Dropdown(id='tab2_tickinput',
-                                                                                 options=load_ticks(),
+                                                                                 options=[],
                                                                                  placeholder='Stock',
                                                                                  value='^NSEI',
                                                                                  multi=False,
@@ -500,6 +759,10 @@ app.layout = html.Div([dcc.Tabs([
                                                                  interval=30 * 1000,
                                                                  n_intervals=0
                                                                  ),
+                                                    dcc.Store(id='tab2-graph-A-update'),
+                                                    dcc.Store(id='tab2-graph-B-update'),
+                                                    dcc.Store(id='tab2-graph-C-update'),
+                                                    dcc.Store(id='tab2-graph-state'),
                                                     ],
             style={'height': '35px',
                    'padding': '6px'},
@@ -512,81 +775,23 @@ app.layout = html.Div([dcc.Tabs([
         "background": "#F0F8FF"
     }
 )])
+startup.mark('layout')
 
 
-@app.callback(
-    Output(component_id='graph', component_property='figure'),
-    [Input(component_id='tickinput', component_property='value'),
-     Input(component_id='periodinput', component_property='value'),
-     Input(component_id='intervalinput', component_property='value'),
-     Input(component_id='interval-component', component_property='n_intervals'),
-     Input(component_id='indicator_sel', component_property='value'),
-     Input(component_id='compare', component_property='value')],
-    # prevent_initial_call=True
-)
-def callback1(tick, period, interval, n, indicator_sel, compare):
-    global df
-    df = load_data(period, interval, tick, compare)
-
-    trace = {
-        'type': 'candlestick',
-        'open': df.Open,
-        'high': df.High,
-        'low': df.Low,
-        'close': df.Close,
-        'x': df.index,
-        'name': tick.upper(),
-        'hoverinfo': 'x'
-    }
-
-    layout = go.Layout({
-        'xaxis_title': 'Time',
-        # 'yaxis_title': 'Price',
-        'xaxis': {
-            # 'type': 'category',
-            'showspikes': True,
-            'spikemode': 'across',
-            'spikesnap': 'cursor',
-            'spikecolor': 'black',
-            'spikethickness': 1
-        },
-        'yaxis': {
-            'showspikes': True,
-            'spikemode': 'across',
-            'spikesnap': 'cursor',
-            'spikecolor': 'black',
-            'spikethickness': 1,
-            'side': 'right'
-        },
-        'width': 1500,
-        'height': 700,
-        'dragmode': 'pan',
-        'hovermode': 'x',
-        'xaxis_rangeslider_visible': False,
-        'modebar': {
-            'orientation': 'v'},
-        'uirevision': (period + interval + tick + str(compare)),
-        'spikedistance': -1, 'hoverdistance': 100,
-        'template': 'plotly_white',
-        'legend': {
-            'orientation': 'h'
-        },
-        'margin': {
-            'l': 80, 'r': 80, 't': 20, 'b': 80
-        },
-        # 'paper_bgcolor': "#19334d",
-        # 'plot_bgcolor': "#d8e6f3"
-    })
-
-    fig = go.Figure(data=trace, layout=layout)
-
-    if compare is not None and compare != []:
-        for c in compare:
-            dfc = load_data(period, interval, c)
-            dfc = dfc - dfc['Close'].iloc[0]
-            comptrace = {
-                'x': dfc.index,
-                'y': dfc.Close,
+def compare_traces(df, fp, runs, frames, fingerprints, symbols, norm):
+    # the compare lines share the main chart's timestamps and buckets; frames and symbols start with the main one
+    key = ('compare', fp, tuple(runs), fingerprints, tuple(symbols), norm)
+    traces = trace_cache.get(key)
+    if traces is None:
+        loaded = [j for j, f in enumerate(frames) if f is not None]
+        panel = Panel.align(df.index, [frames[j] for j in loaded], [symbols[j] for j in loaded])
+        y = panel.normalized(norm)
+        traces = []
+        for j, c in enumerate(panel.symbols[1:], 1):
+            x, yj = line_points(df.index, y[:, j], runs)
+            traces.append({
+                'x': x,
+                'y': yj,
                 'type': 'scatter',
                 'mode': 'lines',
                 'line': {
@@ -595,242 +800,153 @@ def callback1(tick, period, interval, n, indicator_sel, compare):
                 },
                 'hoverinfo': 'skip',
                 'name': c.upper()
+            })
+        trace_cache.put(key, traces)
+    return traces
+
 
+def indicator_traces(indicators, df, ind, runs):
+    key = ('indicator', indicators.fingerprint, ind, tuple(runs))
+    traces = trace_cache.get(key)
+    if traces is not None:
+        return traces
+    if ind == 'bulleng':
+        with timed('patterns'):
+            traces = [engulfing_trace(df, indicators.get('engulfing'), 100, 'rgba(0,128,0,0.25)',
+                                      'Bullish Engulfing')]
+    elif ind == 'beareng':
+        with timed('patterns'):
+            traces = [engulfing_trace(df, indicators.get('engulfing'), -100, 'rgba(255,0,0,0.25)',
+                                      'Bearish Engulfing')]
+    else:
+        traces = []
+        for name, params, field, style in OVERLAYS.get(ind, []):
+            with timed('indicators'):
+                y = indicators.get(name, **params)
+            x, y = line_points(df.index, y if field is None else y[field], runs)
+            trace = {
+                'x': x,
+                'y': y,
+                'type': 'scatter',
+                'mode': 'lines',
+                'hoverinfo': 'skip'
             }
-            fig.add_trace(comptrace)
+            trace.update(style)
+            traces.append(trace)
+    return trace_cache.put(key, traces)
+
+
+def chart_figure(df, fp, view, runs, frames, fingerprints, tick, period, interval, indicator_sel, compare, norm):
+    # each stage is cached on its own inputs: the price trace on the series and view, the compare lines on the
+    # series they are aligned from, an indicator's traces on the series it is computed from; frames are the
+    # fetched main and compare series
+    key = ('price', tick, fp, tuple(runs))
+    price = trace_cache.get(key)
+    if price is None:
+        price = trace_cache.put(key, candlestick(view, tick.upper()))
+    data = [price]
+
+    if compare:
+        data.extend(compare_traces(df, fp, runs, frames, fingerprints, [tick] + compare, norm))
 
     if indicator_sel is not None:
-        df['Engulfing'] = talib.CDLENGULFING(df['Open'], df['High'], df['Low'], df['Close'])
+        indicators = indicator_engine.bind(df, key=chart_key(tick, period, interval, compare, norm), fp=fp)
         for ind in indicator_sel:
-            if ind == 'mov20':
-                trace_mov20 = {
-                    'x': df.index,
-                    'y': talib.MA(df['Close'], timeperiod=20, matype=0),
-                    'type': 'scatter',
-                    'mode': 'lines',
-                    'line': {
-                        'width': 1,
-                        'color': 'fuchsia'
-                    },
-                    'name': 'MovAvg20',
-                    'hoverinfo': 'skip'
-                }
-                fig.add_trace(trace_mov20)
-            elif ind == 'mov50':
-                trace_mov50 = {
-                    'x': df.index,
-                    'y': talib.MA(df['Close'], timeperiod=50, matype=0),
-                    'type': 'scatter',
-                    'mode': 'lines',
-                    'line': {
-                        'width': 1,
-                        'color': 'red'
-                    },
-                    'name': 'MovAvg50',
-                    'hoverinfo': 'skip'
-                }
-                fig.add_trace(trace_mov50)
-            elif ind == 'mov100':
-                trace_mov100 = {
-                    'x': df.index,
-                    'y': talib.MA(df['Close'], timeperiod=100, matype=0),
-                    'type': 'scatter',
-                    'mode': 'lines',
-                    'line': {
-                        'width': 1,
-                        'color': 'green'
-                    },
-                    'name': 'MovAvg100',
-                    'hoverinfo': 'skip'
-                }
-                fig.add_trace(trace_mov100)
-            elif ind == 'mov200':
-                trace_mov200 = {
-                    'x': df.index,
-                    'y': talib.MA(df['Close'], timeperiod=200, matype=0),
-                    'type': 'scatter',
-                    'mode': 'lines',
-                    'line': {
-                        'width': 1,
-                        'color': 'yellow'
-                    },
-                    'name': 'MovAvg200',
-                    'hoverinfo': 'skip'
-                }
-                fig.add_trace(trace_mov200)
-            elif ind == 'bbands':
-                upperband, middleband, lowerband = talib.BBANDS(df['Close'], timeperiod=20, nbdevup=2, nbdevdn=2,
-                                                                matype=0)
-                trace_bbandlow = {
-                    'x': df.index,
-                    'y': lowerband,
-                    'type': 'scatter',
-                    'mode': 'lines',
-                    'line': {
-                        'width': 1,
-                        'color': 'green'
-                    },
-                    'name': 'BBlow',
-                    'hoverinfo': 'skip'
-                }
-                fig.add_trace(trace_bbandlow)
-                trace_bbandup = {
-                    'x': df.index,
-                    'y': upperband,
-                    'type': 'scatter',
-                    'mode': 'lines',
-                    'line': {
-                        'width': 1,
-                        'color': 'green'
-                    },
-                    'fill': 'tonexty',
-                    'fillcolor': 'rgba(173,204,255,0.2)',
-                    'name': 'BBup',
-                    'hoverinfo': 'skip'
-                }
-                fig.add_trace(trace_bbandup)
-                trace_bbandmid = {
-                    'x': df.index,
-                    'y': middleband,
-                    'type': 'scatter',
-                    'mode': 'lines',
-                    'line': {
-                        'width': 1,
-                        'color': 'brown'
-                    },
-                    'name': 'BBmid',
-                    'hoverinfo': 'skip'
-                }
-                fig.add_trace(trace_bbandmid)
-            elif ind == 'ema':
-                trace_ema = {
-                    'x': df.index,
-                    'y': talib.EMA(df['Close'], timeperiod=9),
-                    'type': 'scatter',
-                    'mode': 'lines',
-                    'line': {
-                        'width': 1,
-                        'color': 'purple'
-                    },
-                    'name': 'EMA',
-                    'hoverinfo': 'skip'
-                }
-                fig.add_trace(trace_ema)
-            elif ind == 'sar':
-                trace_sar = {
-                    'x': df.index,
-                    'y': talib.SAR(df['High'], df['Close'], acceleration=0.02, maximum=0.2),
-                    'type': 'scatter',
-                    'mode': 'markers',
-                    'marker': {
-                        'size': 3,
-                        'color': 'orange'
-                    },
-                    'name': 'SAR',
-                    'hoverinfo': 'skip'
-
-                }
-                fig.add_trace(trace_sar)
-            elif ind == 'ichi':
-                tenkan_sen = (df['High'].rolling(window=9).max() + df['Low'].rolling(window=9).min()) / 2
-                kijun_sen = (df['High'].rolling(window=26).max() + df['Low'].rolling(window=26).min()) / 2
-                senkou_span_a = ((tenkan_sen + kijun_sen) / 2).shift(26)
-                senkou_span_b = ((df['High'].rolling(window=52).max() + df['Low'].rolling(window=52).min()) / 2).shift(
-                    26)
-                chikou_span = df['Close'].shift(-26)
-                trace_tenkan = {
-                    'x': df.index,
-                    'y': tenkan_sen,
-                    'type': 'scatter',
-                    'mode': 'lines',
-                    'line': {
-                        'width': 1,
-                        'color': 'cyan'
-                    },
-                    'name': 'tenkan_sen',
-                    'hoverinfo': 'skip'
-                }
-                fig.add_trace(trace_tenkan)
-                trace_kijun = {
-                    'x': df.index,
-                    'y': kijun_sen,
-                    'type': 'scatter',
-                    'mode': 'lines',
-                    'line': {
-                        'width': 1,
-                        'color': 'maroon'
-                    },
-                    'name': 'kijun_sen',
-                    'hoverinfo': 'skip'
-                }
-                fig.add_trace(trace_kijun)
-                trace_senkou_span_a = {
-                    'x': df.index,
-                    'y': senkou_span_a,
-                    'type': 'scatter',
-                    'mode': 'lines',
-                    'line': {
-                        'width': 1,
-                        'color': 'green'
-                    },
-                    'name': 'senkou_span_a',
-                    'hoverinfo': 'skip'
-                }
-                fig.add_trace(trace_senkou_span_a)
-                trace_senkou_span_b = {
-                    'x': df.index,
-                    'y': senkou_span_b,
-                    'type': 'scatter',
-                    'mode': 'lines',
-                    'line': {
-                        'width': 1,
-                        'color': 'red'
-                    },
-                    'fill': 'tonexty',
-                    'fillcolor': 'rgba(173,204,255,0.2)',
-                    'name': 'senkou_span_b',
-                    'hoverinfo': 'skip'
-                }
-                fig.add_trace(trace_senkou_span_b)
-                trace_chikou_span = {
-                    'x': df.index,
-                    'y': chikou_span,
-                    'type': 'scatter',
-                    'mode': 'lines',
-                    'line': {
-                        'width': 1,
-                        'color': 'green'
-                    },
-                    'name': 'chikou_span',
-                    'hoverinfo': 'skip'
-                }
-                fig.add_trace(trace_chikou_span)
-            elif ind == 'bulleng':
-                for i, j in df.iterrows():
-                    if j['Engulfing'] != 100:
-                        k = i
-                        continue
-                    else:
-                        fig.add_vrect(
-                            x0=k, x1=i,
-                            annotation_text="BE", annotation_position="top left",
-                            fillcolor="green", opacity=0.25,
-                            line_width=0, line_color='green')
-            elif ind == 'beareng':
-                for i, j in df.iterrows():
-                    if j['Engulfing'] != -100:
-                        k = i
-                        continue
-                    else:
-                        fig.add_vrect(
-                            x0=k, x1=i,
-                            # x0=k-datetime.timedelta(hours=6), x1=i+datetime.timedelta(hours=6),
-                            annotation_text="BE", annotation_position="top left",
-                            fillcolor="red", opacity=0.25,
-                            line_width=0, line_color='red'
-                        )
-    fig = rangebreak(fig, period, interval)
-    return fig
+            data.extend(indicator_traces(indicators, df, ind, runs))
+
+    uirevision = period + interval + tick + str(compare) + (norm if compare else '')
+    return {'data': data, 'layout': layout(1500, 700, uirevision, period, interval)}
+
+
+@figure_callback(
+    app, figure_cache,
+    [Output(component_id='graph-update', component_property='data'),
+     Output(component_id='graph-state', component_property='data')],
+    [Input(component_id='tickinput', component_property='value'),
+     Input(component_id='periodinput', component_property='value'),
+     Input(component_id='intervalinput', component_property='value'),
+     Input(component_id='interval-component', component_property='n_intervals'),
+     Input(component_id='indicator_sel', component_property='value'),
+     Input(component_id='compare', component_property='value'),
+     Input(component_id='viewport', component_property='data'),
+     Input(component_id='compare-norm', component_property='value')],
+    State(component_id='graph-state', component_property='data'),
+    # prevent_initial_call=True
+)
+def callback1(tick, period, interval, n, indicator_sel, compare, window, norm, state):
+    # toggling an indicator or compare symbol, switching the normalization or zooming redraws the series already
+    # on screen; only the interval tick and a new symbol, period or interval go back to the data cache
+    triggered = {t['prop_id'] for t in dash.callback_context.triggered}
+    redraw = triggered <= {'indicator_sel.value', 'compare.value', 'viewport.data', 'compare-norm.value'}
+    key, make_figure, identity, base, buckets = chart_update(tick, period, interval, indicator_sel, compare, window,
+                                                             norm, state, current_cached if redraw else fresh_data)
+    return key, lambda: figure_update(make_figure(), identity, base, buckets)
+
+
+def chart_update(tick, period, interval, indicator_sel, compare, window, norm, state, cached=fresh_data):
+    # returns the cache key of the update, a function building the figure, the chart identity, the delta base and
+    # the bucket sizes
+    compare = compare or []
+    norm = norm or 'offset'
+    frames = fetch_many([(period, interval, tick)] + [(period, interval, c) for c in compare], cached=cached)
+    if frames[0] is None:
+        raise PreventUpdate
+    df = rebase(frames[0], compare, norm)
+    key = chart_key(tick, period, interval, compare, norm)
+    runs, view = chart_view(df, window)
+    chart_frames.put(key + (tuple(window or ()),), view)
+    # a refresh of an unchanged chart only sends its tail, as long as its candles are bucketed as the browser's
+    # are; it goes whole when the bars per bucket change. Compare lines are aligned to the main chart's bars, so its
+    # buckets are the only ones that matter
+    identity = [tick, period, interval, compare, indicator_sel or [], window, norm]
+    buckets = bucket_sizes(runs)
+    base = delta_base(state, identity, buckets)
+    # the update only depends on the inputs, the bars in view, the series content and what the browser holds
+    fingerprints = tuple(None if f is None else fingerprint(f) for f in frames)
+    fp = fingerprint(df) if compare else fingerprints[0]
+    return (('graph',) + key + (tuple(indicator_sel or []), tuple(runs), fingerprints, base),
+            lambda: chart_figure(df, fp, view, runs, frames, fingerprints, tick, period, interval, indicator_sel,
+                                 compare, norm),
+            identity, base, buckets)
+
+
+app.clientside_callback(ClientsideFunction('charts', 'apply'),
+                        Output('graph', 'figure'),
+                        Input('graph-update', 'data'),
+                        State('graph', 'figure'))
+
+app.clientside_callback(ClientsideFunction('charts', 'subscribe'),
+                        Output('graph-push', 'data'),
+                        [Input('graph-state', 'data'),
+                         Input('stream-check', 'n_intervals')])
+
+
+@app.callback(Output('viewport', 'data'),
+              [Input('graph', 'relayoutData'),
+               Input('tickinput', 'value'),
+               Input('periodinput', 'value'),
+               Input('intervalinput', 'value')])
+def update_viewport(relayout, tick, period, interval):
+    # a new series starts unzoomed; zooms and pans re-slice the chart at the resolution of the new range
+    if dash.callback_context.triggered[0]['prop_id'] != 'graph.relayoutData':
+        return None
+    window = viewport(relayout)
+    if window is False:
+        raise PreventUpdate
+    return window
+
+
+@app.callback(Output('interval-component', 'interval'),
+              [Input('interval-component', 'n_intervals'),
+               Input('intervalinput', 'value'),
+               Input('graph-push', 'data')])
+def schedule_refresh(n, interval, push):
+    # the next tick lands when the chart can next show new bars: the data's freshness in session, the next open
+    # outside it; while the chart is fed over /stream, polling is only a slow safety net
+    delay = refresh_delay(interval)
+    if push:
+        delay = max(delay, PUSH_FALLBACK_POLL)
+    return int(1000 * delay)
 
 
 @app.callback(Output(component_id='intervalinput', component_property='value'),
@@ -841,16 +957,41 @@ def update_interval(p):
     return period_int(p)
 
 
+def register_symbol_search(dropdown_id):
+    # the layout ships no option lists; each symbol dropdown asks for the matches of what is typed into it
+    @app.callback(Output(dropdown_id, 'options'),
+                  Input(dropdown_id, 'search_value'),
+                  State(dropdown_id, 'value'))
+    def symbol_options(search_value, value):
+        return symbols.dropdown_options(search_value, value)
+
+
+for dropdown in ('tickinput', 'compare', 'tab2_tickinput'):
+    register_symbol_search(dropdown)
+
+
 @app.callback([Output('displayhover', 'children'),
                Output('displayhover', 'style')],
               Input('graph', 'hoverData'),
+              [State('tickinput', 'value'),
+               State('periodinput', 'value'),
+               State('intervalinput', 'value'),
+               State('compare', 'value'),
+               State('viewport', 'data'),
+               State('compare-norm', 'value')],
               prevent_initial_call=True
               )
-def display_hover_data(hoverData):
-    open = round(df.Open[df.index == hoverData["points"][0]['x']].sum(), 2)
-    high = round(df.High[df.index == hoverData["points"][0]['x']].sum(), 2)
-    low = round(df.Low[df.index == hoverData["points"][0]['x']].sum(), 2)
-    close = round(df.Close[df.index == hoverData["points"][0]['x']].sum(), 2)
+def display_hover_data(hoverData, tick, period, interval, compare, window, norm):
+    norm = norm or 'offset'
+    key = chart_key(tick, period, interval, compare, norm) + (tuple(window or ()),)
+    df = chart_frames.get(key)
+    if df is None:
+        # rendered by another worker or evicted; rebuild it from the data cache
+        df = chart_frames.put(key, chart_view(load_data(period, interval, tick, compare, norm), window)[1])
+    values = ohlc_at(df, hoverData["points"][0]['x'])
+    if values is None:
+        raise PreventUpdate
+    open, high, low, close = [round(v, 2) for v in values]
     ohlc = 'O-' + str(open) + '\t' + 'H-' + str(high) + '\t' + 'L-' + str(low) + '\t' + 'C-' + str(close)
     if close > open:
         color = 'forestgreen'
@@ -860,172 +1001,78 @@ def display_hover_data(hoverData):
     return ohlc, style
 
 
-@app.callback([Output('tab2-graph-A', 'figure'),
-               Output('tab2-graph-B', 'figure'),
-               Output('tab2-graph-C', 'figure')],
-              [Input('tab2_tickinput', 'value'),
-               Input('tab2-periodinput-A', 'value'),
-               Input('tab2-intervalinput-A', 'value'),
-               Input('tab2-periodinput-B', 'value'),
-               Input('tab2-intervalinput-B', 'value'),
-               Input('tab2-periodinput-C', 'value'),
-               Input('tab2-intervalinput-C', 'value'),
-               Input('tab2-interval-component', 'n_intervals')],
-              # prevent_initial_call=True
-              )
-def tab2_callback(tick2, periodA, intervalA, periodB, intervalB, periodC, intervalC, n):
-    dfA = load_data(periodA, intervalA, tick2)
-    dfB = load_data(periodB, intervalB, tick2)
-    dfC = load_data(periodC, intervalC, tick2)
-    layoutA = go.Layout({
-        'xaxis_title': 'Time',
-        # 'yaxis_title': 'Price',
-        'xaxis': {
-            'showspikes': True,
-            'spikemode': 'across',
-            'spikesnap': 'cursor',
-            'spikecolor': 'black',
-            'spikethickness': 1
-        },
-        'yaxis': {
-            'showspikes': True,
-            'spikemode': 'across',
-            'spikesnap': 'cursor',
-            'spikecolor': 'black',
-            'spikethickness': 1,
-            'side': 'right'
-        },
-        'width': 750,
-        'height': 300,
-        'dragmode': 'pan',
-        'hovermode': 'x',
-        'xaxis_rangeslider_visible': False,
-        'modebar': {
-            'orientation': 'v'},
-        'uirevision': (periodA + intervalA + tick2),
-        'spikedistance': -1, 'hoverdistance': 100,
-        'template': 'plotly_white',
-        'legend': {
-            'orientation': 'h'
-        },
-        'margin': {
-            'l': 80, 'r': 80, 't': 20, 'b': 80
-        },
-    })
-
-    dataA = {
-        'type': 'candlestick',
-        'open': dfA.Open,
-        'high': dfA.High,
-        'low': dfA.Low,
-        'close': dfA.Close,
-        'x': dfA.index,
-        'name': tick2.upper(),
-        'hoverinfo': 'x'
-    }
-    figA = go.Figure(data=dataA, layout=layoutA)
-
-    layoutB = go.Layout({
-        'xaxis_title': 'Time',
-        # 'yaxis_title': 'Price',
-        'xaxis': {
-            'showspikes': True,
-            'spikemode': 'across',
-            'spikesnap': 'cursor',
-            'spikecolor': 'black',
-            'spikethickness': 1
-        },
-        'yaxis': {
-            'showspikes': True,
-            'spikemode': 'across',
-            'spikesnap': 'cursor',
-            'spikecolor': 'black',
-            'spikethickness': 1,
-            'side': 'right'
-        },
-        'width': 750,
-        'height': 300,
-        'dragmode': 'pan',
-        'hovermode': 'x',
-        'xaxis_rangeslider_visible': False,
-        'modebar': {
-            'orientation': 'v'},
-        'uirevision': (periodB + intervalB + tick2),
-        'spikedistance': -1, 'hoverdistance': 100,
-        'template': 'plotly_white',
-        'legend': {
-            'orientation': 'h'
-        },
-        'margin': {
-            'l': 80, 'r': 80, 't': 20, 'b': 80
-        },
-    })
-
-    dataB = {
-        'type': 'candlestick',
-        'open': dfB.Open,
-        'high': dfB.High,
-        'low': dfB.Low,
-        'close': dfB.Close,
-        'x': dfB.index,
-        'name': tick2.upper(),
-        'hoverinfo': 'x'
-    }
-    figB = go.Figure(data=dataB, layout=layoutB)
-
-    layoutC = go.Layout({
-        'xaxis_title': 'Time',
-        # 'yaxis_title': 'Price',
-        'xaxis': {
-            'showspikes': True,
-            'spikemode': 'across',
-            'spikesnap': 'cursor',
-            'spikecolor': 'black',
-            'spikethickness': 1
-        },
-        'yaxis': {
-            'showspikes': True,
-            'spikemode': 'across',
-            'spikesnap': 'cursor',
-            'spikecolor': 'black',
-            'spikethickness': 1,
-            'side': 'right'
-        },
-        'width': 1500,
-        'height': 350,
-        'dragmode': 'pan',
-        'hovermode': 'x',
-        'xaxis_rangeslider_visible': False,
-        'modebar': {
-            'orientation': 'v'},
-        'uirevision': (periodB + intervalB + tick2),
-        'spikedistance': -1, 'hoverdistance': 100,
-        'template': 'plotly_white',
-        'legend': {
-            'orientation': 'h'
-        },
-        'margin': {
-            'l': 80, 'r': 80, 't': 20, 'b': 80
-        },
-    })
-
-    dataC = {
-        'type': 'candlestick',
-        'open': dfC.Open,
-        'high': dfC.High,
-        'low': dfC.Low,
-        'close': dfC.Close,
-        'x': dfC.index,
-        'name': tick2.upper(),
-        'hoverinfo': 'x'
-    }
-    figC = go.Figure(data=dataC, layout=layoutC)
+def pane_figure(df, tick, period, interval, width, height, uirevision):
+    if df is None:
+        return no_update
+    return {'data': [candlestick(chart_view(df, None, width)[1], tick.upper())],
+            'layout': layout(width, height, uirevision, period, interval)}
+
+
+def pane_buckets(df, width):
+    return None if df is None else bucket_sizes(view_runs(df, None, width))
+
+
+def pane_base(df, state, identity, width):
+    if df is None:
+        return None
+    return delta_base(state, identity, pane_buckets(df, width))
+
 
-    figA = rangebreak(figA, periodA, intervalA)
-    figB = rangebreak(figB, periodB, intervalB)
-    figC = rangebreak(figC, periodC, intervalC)
+@figure_callback(app, figure_cache,
+                 [Output('tab2-graph-A-update', 'data'),
+                  Output('tab2-graph-B-update', 'data'),
+                  Output('tab2-graph-C-update', 'data'),
+                  Output('tab2-graph-state', 'data')],
+                 [Input('tab2_tickinput', 'value'),
+                  Input('tab2-periodinput-A', 'value'),
+                  Input('tab2-intervalinput-A', 'value'),
+                  Input('tab2-periodinput-B', 'value'),
+                  Input('tab2-intervalinput-B', 'value'),
+                  Input('tab2-periodinput-C', 'value'),
+                  Input('tab2-intervalinput-C', 'value'),
+                  Input('tab2-interval-component', 'n_intervals')],
+                 State('tab2-graph-state', 'data'),
+                 # prevent_initial_call=True
+                 )
+def tab2_callback(tick2, periodA, intervalA, periodB, intervalB, periodC, intervalC, n, states):
+    dfA, dfB, dfC = load_frames(tick2, [(periodA, intervalA), (periodB, intervalB), (periodC, intervalC)])
+    if dfA is None and dfB is None and dfC is None:
+        raise PreventUpdate
+    states = states or [None, None, None]
+    panes = [(dfA, periodA, intervalA, 750, 300, periodA + intervalA + tick2),
+             (dfB, periodB, intervalB, 750, 300, periodB + intervalB + tick2),
+             (dfC, periodC, intervalC, 1500, 350, periodB + intervalB + tick2)]
+    identities = [[tick2, period, interval, uirevision] for df, period, interval, width, height, uirevision in panes]
+    bases = tuple(pane_base(pane[0], state, identity, pane[3]) for pane, state, identity
+                  in zip(panes, states, identities))
+    fingerprints = tuple(None if f is None else fingerprint(f) for f in (dfA, dfB, dfC))
 
-    return figA, figB, figC
+    def build():
+        updates = [figure_update(pane_figure(df, tick2, period, interval, width, height, uirevision), identity, base,
+                                 pane_buckets(df, width))
+                   for (df, period, interval, width, height, uirevision), identity, base
+                   in zip(panes, identities, bases)]
+        # a pane that failed to load is sent whole once it's back
+        return [update for update, state in updates] + [[None if state is no_update else state
+                                                         for update, state in updates]]
+
+    return ('tab2', tick2, periodA, intervalA, periodB, intervalB, periodC, intervalC, fingerprints, bases), build
+
+
+for pane in ('A', 'B', 'C'):
+    app.clientside_callback(ClientsideFunction('charts', 'apply'),
+                            Output('tab2-graph-%s' % pane, 'figure'),
+                            Input('tab2-graph-%s-update' % pane, 'data'),
+                            State('tab2-graph-%s' % pane, 'figure'))
+
+
+@app.callback(Output('tab2-interval-component', 'interval'),
+              [Input('tab2-interval-component', 'n_intervals'),
+               Input('tab2-intervalinput-A', 'value'),
+               Input('tab2-intervalinput-B', 'value'),
+               Input('tab2-intervalinput-C', 'value')])
+def tab2_schedule_refresh(n, intervalA, intervalB, intervalC):
+    return int(1000 * min(refresh_delay(i) for i in (intervalA, intervalB, intervalC)))
 
 
 @app.callback([Output('tab2-intervalinput-A', 'value'),
@@ -1040,5 +1087,170 @@ def tab2_update_interval(pA, pB, pC):
     return period_int(pA), period_int(pB), period_int(pC)
 
 
+startup.mark('callbacks')
+
+
+def warm_start():
+    # called in the gunicorn master before it forks (see gunicorn.conf.py), so every worker inherits plotly's
+    # validated chart layouts instead of importing plotly.graph_objects on its first request
+    for width, height in ((1500, 700), (750, 300), (1500, 350)):
+        layout_template(width, height)
+    startup.mark('warm')
+
+
+# large caps loaded ahead of demand on top of the layout defaults; PREFETCH_SYMBOLS replaces the list
+HOT_SYMBOLS = ['RELIANCE.NS', 'TCS.NS', 'HDFCBANK.NS', 'INFY.NS', 'ICICIBANK.NS']
+PREFETCH_EVERY = int(os.environ.get('PREFETCH_EVERY', 30))
+PREFETCH_RATE = float(os.environ.get('PREFETCH_RATE', 1))
+PREFETCH_HOT = int(os.environ.get('PREFETCH_HOT', 10))
+
+
+def prefetch_views():
+    # (period, interval, tick) series behind the views a first visit opens, then the hot symbols at the main
+    # chart's default period, then whatever has been requested most
+    period = app.layout['periodinput'].value
+    views = [(period, period_int(period), app.layout['tickinput'].value)]
+    tick2 = app.layout['tab2_tickinput'].value
+    specs = [(app.layout['tab2-periodinput-%s' % p].value, period_int(app.layout['tab2-periodinput-%s' % p].value))
+             for p in 'ABC']
+    views.extend((spec[0], spec[1], tick2) for spec, source in plan_frames(specs).items() if source is None)
+    hot = os.environ.get('PREFETCH_SYMBOLS')
+    views.extend((period, period_int(period), tick) for tick in (hot.split(',') if hot else HOT_SYMBOLS))
+    with usage_lock:
+        views.extend(key[1:] + key[:1] for key, count in fetch_usage.most_common(PREFETCH_HOT))
+        # decay, so the ranking follows recent traffic and series nobody asks for any more drop out
+        for key, count in list(fetch_usage.items()):
+            if count > 1:
+                fetch_usage[key] = count // 2
+            else:
+                del fetch_usage[key]
+    return list(dict.fromkeys(views))
+
+
+def prefetch_fresh(view, horizon):
+    period, interval, tick = view
+    key = (tick, period, interval)
+    left = ohlcv_cache.ttl_left(key)
+    if left is not None and left > horizon:
+        return True
+    # outside the session no bar can change until the next open, so a series loaded since the close is current
+    loaded = series_loaded.get(key)
+    if loaded is None:
+        return False
+    next_bars = loaded + datetime.timedelta(seconds=refresh_delay(interval, loaded))
+    return next_bars > now() + datetime.timedelta(seconds=horizon)
+
+
+def prefetch_load(view):
+    period, interval, tick = view
+    fetch_flights.do((tick, period, interval), lambda: load_series(period, interval, tick), timeout=FETCH_TIMEOUT)
+
+
+prefetcher = Prefetcher(prefetch_views, prefetch_load, prefetch_fresh, every=PREFETCH_EVERY, rate=PREFETCH_RATE)
+
+
+def start_prefetch():
+    # threads don't survive a fork, so each gunicorn worker starts its own (see gunicorn.conf.py); PREFETCH=0
+    # turns it off
+    if os.environ.get('PREFETCH', '1') != '0':
+        prefetcher.start()
+
+
+# seconds between polls of a chart that is also receiving pushed updates
+PUSH_FALLBACK_POLL = 300
+
+
+def push_chart(key, last):
+    # one refresh of a pushed chart, shared by every session watching it; None when its data hasn't changed
+    tick, period, interval, compare, indicator_sel, window, norm = json.loads(key)
+    try:
+        cache_key, make_figure, identity, base, buckets = chart_update(tick, period, interval, indicator_sel, compare,
+                                                                       window, norm, last and last['graph'])
+    except PreventUpdate:
+        return None
+    if last is not None and cache_key == last['key']:
+        return None
+    with timed('figure'):
+        figure = make_figure()
+    update, state = figure_update(figure, identity, base, buckets)
+    return encode({'figure': figure}), encode(update), {'key': cache_key, 'graph': state}
+
+
+def push_delay(key):
+    return refresh_delay(json.loads(key)[2])
+
+
+push_hub = Hub(push_chart, push_delay)
+# every open stream holds one of the worker's threads; past this many, browsers are turned away and keep polling,
+# so Dash callbacks always have threads left (see gunicorn.conf.py)
+STREAM_LIMIT = int(os.environ.get('STREAM_LIMIT', int(os.environ.get('GUNICORN_THREADS', 32)) // 2))
+stream_slots = threading.BoundedSemaphore(STREAM_LIMIT)
+
+
+@server.route('/stream')
+def stream():
+    # server-sent chart updates for the chart identity in ?key= (the browser's graph-state key)
+    try:
+        tick, period, interval, compare, indicator_sel, window, norm = json.loads(flask.request.args['key'])
+        identity = [str(tick), str(period), str(interval), [str(c) for c in compare],
+                    [str(i) for i in indicator_sel], None if not window else [str(w) for w in window[:2]], str(norm)]
+    except (KeyError, TypeError, ValueError):
+        flask.abort(400)
+    if identity[-1] not in NORMALIZATIONS:
+        flask.abort(400)
+    if not stream_slots.acquire(blocking=False):
+        # EventSource gives up on a non-200 answer; the page falls back to polling and retries later
+        return flask.Response('stream limit reached', status=503, headers={'Retry-After': '60'})
+    response = flask.Response(push_hub.stream(json.dumps(identity, separators=(',', ':'))),
+                              mimetype='text/event-stream', headers={'Cache-Control': 'no-cache',
+                                                                     'X-Accel-Buffering': 'no'})
+    # called when the server closes the response, whether or not streaming ever started
+    response.call_on_close(stream_slots.release)
+    return response
+
+
+@server.route('/startup')
+def startup_report():
+    return flask.jsonify(startup.report())
+
+
+@metrics.registry.collector(('cache',))
+def cache_metrics():
+    caches = {'ohlcv': ohlcv_cache, 'latest': latest_frames, 'chart_frames': chart_frames, 'figure': figure_cache,
+              'trace': trace_cache, 'indicator': indicator_engine.cache}
+    stats = {name: cache.stats() for name, cache in caches.items()}
+    return {
+        'stockview_cache_hits_total': ('counter', 'Cache hits.', {(n,): s['hits'] for n, s in stats.items()}),
+        'stockview_cache_misses_total': ('counter', 'Cache misses.', {(n,): s['misses'] for n, s in stats.items()}),
+        'stockview_cache_hit_ratio': ('gauge', 'Hits over lookups since start.',
+                                      {(n,): s['hit_ratio'] for n, s in stats.items()}),
+        'stockview_cache_entries': ('gauge', 'Entries held.', {(n,): s['entries'] for n, s in stats.items()}),
+        'stockview_cache_bytes': ('gauge', 'Bytes held.', {(n,): s['bytes'] for n, s in stats.items()}),
+    }
+
+
+@metrics.registry.collector(('component', 'stat'))
+def worker_metrics():
+    values = {}
+    for component, stats in (('singleflight', fetch_flights.stats()), ('push', push_hub.stats()),
+                             ('prefetch', prefetcher.stats())):
+        values.update({(component, stat): value for stat, value in stats.items()})
+    return {'stockview_worker_stat': ('gauge', 'Fetch collapsing, push and prefetch counters.', values)}
+
+
+metrics.install(server, app.callback_map)
+
+# requests sent with X-Profile: <PROFILE_TOKEN>, and a PROFILE_RATE share of the rest that take PROFILE_MIN_MS or
+# more, are profiled into PROFILE_DIR; the newest PROFILE_KEEP are browsable at /admin/profiles
+profile_store = profiling.ProfileStore(os.environ.get('PROFILE_DIR', 'profiles'),
+                                       keep=int(os.environ.get('PROFILE_KEEP', 50)))
+profiling.install(server, app.callback_map, profile_store,
+                  token=os.environ.get('PROFILE_TOKEN'), rate=float(os.environ.get('PROFILE_RATE', 0)),
+                  min_ms=float(os.environ.get('PROFILE_MIN_MS', 500)))
+
+
+startup.log()
+
 if __name__ == '__main__':
+    start_prefetch()
     app.run_server(debug=True)
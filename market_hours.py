@@ -0,0 +1,76 @@
+import datetime
+import os
+import warnings
+
+import pandas as pd
+
+from data_cache import interval_ttl
+
+# NSE and BSE cash sessions share these hours
+TZ = 'Asia/Kolkata'
+SESSION_OPEN = datetime.time(9, 15)
+SESSION_CLOSE = datetime.time(15, 30)
+# one last refresh this long after the close picks up the final bars; the first after the open waits OPEN_GRACE
+CLOSE_GRACE = 120
+OPEN_GRACE = 5
+# dcc.Interval runs on setInterval, which can't wait much longer than 24 days; a day keeps clients in step
+MAX_DELAY = 24 * 3600
+MIN_DELAY = 1
+
+# exchange holidays as published in the NSE trading holiday circular each December; MARKET_HOLIDAYS names a file
+# in the same format (YYYY-MM-DD first on each line) to use instead
+HOLIDAYS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'market_holidays.csv')
+
+
+def load_holidays(path):
+    with open(path) as f:
+        return {datetime.date.fromisoformat(line.split(',')[0].strip()) for line in f if line[:1].isdigit()}
+
+
+HOLIDAYS_PATH = os.environ.get('MARKET_HOLIDAYS') or HOLIDAYS_FILE
+HOLIDAYS = load_holidays(HOLIDAYS_PATH)
+if pd.Timestamp.now(tz=TZ).year not in {day.year for day in HOLIDAYS}:
+    # every weekday would count as a session, so charts and the prefetcher would poll through holidays
+    warnings.warn('%s lists no market holidays for %d; add them from the exchange circular'
+                  % (HOLIDAYS_PATH, pd.Timestamp.now(tz=TZ).year), RuntimeWarning)
+
+
+def now():
+    return pd.Timestamp.now(tz=TZ).to_pydatetime()
+
+
+def is_trading_day(day):
+    return day.weekday() < 5 and day not in HOLIDAYS
+
+
+def at(day, t, tzinfo):
+    return datetime.datetime.combine(day, t, tzinfo=tzinfo)
+
+
+def next_open(moment):
+    day = moment.date()
+    if is_trading_day(day) and moment < at(day, SESSION_OPEN, moment.tzinfo):
+        return at(day, SESSION_OPEN, moment.tzinfo)
+    for _ in range(366):
+        day += datetime.timedelta(days=1)
+        if is_trading_day(day):
+            return at(day, SESSION_OPEN, moment.tzinfo)
+    return moment + datetime.timedelta(seconds=MAX_DELAY)
+
+
+def refresh_delay(interval, moment=None):
+    """Seconds until a chart of ``interval`` bars can next show new data.
+
+    During a session that is the interval's cache freshness, as the forming bar keeps moving; the last refresh
+    of the day lands just after the close, and the next one just after the following session opens.
+    """
+    moment = now() if moment is None else moment
+    day = moment.date()
+    if is_trading_day(day):
+        opens = at(day, SESSION_OPEN, moment.tzinfo)
+        last = at(day, SESSION_CLOSE, moment.tzinfo) + datetime.timedelta(seconds=CLOSE_GRACE)
+        if opens <= moment < last:
+            delay = min(interval_ttl(interval), (last - moment).total_seconds())
+            return max(MIN_DELAY, delay)
+    delay = (next_open(moment) - moment).total_seconds() + OPEN_GRACE
+    return max(MIN_DELAY, min(MAX_DELAY, delay))
@@ -0,0 +1,193 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import flask
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (n, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                             for n, v in zip(names, values))
+
+
+class Histogram:
+
+    def __init__(self, name, help, labels=(), buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s histogram' % self.name]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for labels, series in items:
+            for bound, count in zip(self.buckets, series):
+                lines.append('%s_bucket%s %d' % (self.name, _labels(self.labels + ('le',), labels + (bound,)), count))
+            lines.append('%s_bucket%s %d' % (self.name, _labels(self.labels + ('le',), labels + ('+Inf',)),
+                                              series[-1]))
+            lines.append('%s_sum%s %r' % (self.name, _labels(self.labels, labels), series[-2]))
+            lines.append('%s_count%s %d' % (self.name, _labels(self.labels, labels), series[-1]))
+        return lines
+
+
+class Counter:
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s counter' % self.name]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines.extend('%s%s %r' % (self.name, _labels(self.labels, k), v) for k, v in items)
+        return lines
+
+
+class Registry:
+    """Histograms and counters kept in-process, plus collectors read at scrape time.
+
+    A collector is a function returning ``{metric name: (type, help, {label tuple: value})}`` for state
+    that already lives elsewhere, such as cache statistics.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        metric = Counter(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def collector(self, label_names):
+        def register(func):
+            self.collectors.append((label_names, func))
+            return func
+        return register
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for label_names, func in self.collectors:
+            for name, (kind, help, values) in func().items():
+                lines.append('# HELP %s %s' % (name, help))
+                lines.append('# TYPE %s %s' % (name, kind))
+                lines.extend('%s%s %r' % (name, _labels(label_names, k), v) for k, v in sorted(values.items()))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+stage_seconds = registry.histogram('stockview_stage_seconds', 'Time spent per pipeline stage.', ('stage',))
+request_seconds = registry.histogram('stockview_request_seconds', 'Request time per Dash callback or route.',
+                                     ('callback',))
+payload_bytes = registry.histogram('stockview_payload_bytes', 'Response body size per Dash callback or route.',
+                                   ('callback',), buckets=BYTES_BUCKETS)
+upstream_seconds = registry.histogram('stockview_upstream_seconds', 'Market data provider call time.',
+                                      ('provider',))
+upstream_calls = registry.counter('stockview_upstream_calls_total', 'Market data provider calls.',
+                                  ('provider', 'outcome'))
+
+
+@contextmanager
+def timed(stage):
+    # records into the stage histogram, and into this request's Server-Timing header when there is one
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_seconds.observe(elapsed, stage)
+        if flask.has_request_context():
+            timings = flask.g.setdefault('server_timing', {})
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+def counted(provider_name, func):
+    def call(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            upstream_calls.inc(provider_name, 'error')
+            raise
+        finally:
+            upstream_seconds.observe(time.perf_counter() - started, provider_name)
+        upstream_calls.inc(provider_name, 'ok')
+        return result
+    return call
+
+
+def callback_name(callback_map, body):
+    # the function behind a /_dash-update-component request body
+    output = (body or {}).get('output')
+    return getattr(callback_map.get(output, {}).get('callback'), '__name__', 'unknown')
+
+
+def install(server, callback_map):
+    """Adds /metrics to the Flask server and times every request.
+
+    Dash callback requests are labelled with the name of the function in ``callback_map`` (the app's) that
+    served them, and get a Server-Timing header listing the stages they went through.
+    """
+    @server.before_request
+    def start_timer():
+        flask.g.started = time.perf_counter()
+
+    @server.after_request
+    def record(response):
+        started = flask.g.get('started')
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        if flask.request.path.endswith('/_dash-update-component'):
+            name = callback_name(callback_map, flask.request.get_json(silent=True))
+        elif flask.request.endpoint in ('metrics', 'stream'):
+            return response
+        else:
+            name = flask.request.endpoint or 'static'
+        request_seconds.observe(elapsed, name)
+        if not response.direct_passthrough:
+            payload_bytes.observe(response.calculate_content_length() or 0, name)
+        timings = flask.g.get('server_timing', {})
+        entries = ['%s;dur=%.2f' % (stage, 1000 * seconds) for stage, seconds in timings.items()]
+        entries.append('total;dur=%.2f' % (1000 * elapsed))
+        response.headers['Server-Timing'] = ', '.join(entries)
+        return response
+
+    @server.route('/metrics')
+    def metrics():
+        return flask.Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,47 @@
+import numpy as np
+
+NORMALIZATIONS = ('offset', 'pct', 'log')
+
+
+def normalize(values, base, how='offset'):
+    # values relative to base, broadcast along the last axis: an absolute offset, a percent return or a log return
+    if how == 'pct':
+        return (values / base - 1) * 100
+    if how == 'log':
+        return np.log(values / base)
+    return values - base
+
+
+def first_valid(values):
+    rows = np.argmax(~np.isnan(values), axis=0)
+    return values[rows, np.arange(values.shape[1])]
+
+
+class Panel:
+    """One column per symbol of a price field, aligned on a single timestamp index as a 2-D array.
+
+    A symbol's value at each timestamp is its last bar at or before it, so a holiday or a missing bar in one
+    symbol repeats its previous value instead of shifting the series; timestamps before its first bar are NaN.
+    Timestamps are compared as instants, so symbols quoted in different time zones line up too.
+    """
+
+    def __init__(self, index, values, symbols):
+        self.index = index
+        self.values = values
+        self.symbols = list(symbols)
+
+    @classmethod
+    def align(cls, index, frames, symbols, field='Close'):
+        target = index.asi8
+        values = np.full((len(target), len(frames)), np.nan)
+        for j, df in enumerate(frames):
+            if df is None or not len(df):
+                continue
+            pos = np.searchsorted(df.index.asi8, target, side='right') - 1
+            column = df[field].to_numpy(dtype=float)
+            values[:, j] = np.where(pos >= 0, column[np.maximum(pos, 0)], np.nan)
+        return cls(index, values, symbols)
+
+    def normalized(self, how='offset'):
+        # every symbol against its own first value in the panel
+        return normalize(self.values, first_valid(self.values), how)
@@ -0,0 +1,79 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """Token bucket: acquire() blocks until one of ``burst`` tokens, refilled at ``rate`` per second, is free."""
+
+    def __init__(self, rate, burst=1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.clock = clock
+        self.sleep = sleep
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self._last) * self.rate)
+            self._last = now
+            wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0
+            self.tokens -= 1
+        if wait > 0:
+            self.sleep(wait)
+
+
+class Prefetcher:
+    """Background worker that keeps a list of views loaded ahead of the visitors asking for them.
+
+    Every ``every`` seconds it walks ``views()`` and calls ``load(view)`` for each one ``fresh(view)`` says
+    would go stale before the next pass, at most ``rate`` loads per second. Failures are counted and retried
+    on the next pass.
+    """
+
+    def __init__(self, views, load, fresh, every=30, rate=1.0):
+        self.views = views
+        self.load = load
+        self.fresh = fresh
+        self.every = every
+        self.limiter = RateLimiter(rate)
+        self.passes = 0
+        self.loaded = 0
+        self.skipped = 0
+        self.errors = 0
+        self._thread = None
+        self._stop = threading.Event()
+
+    def run_once(self):
+        for view in self.views():
+            if self._stop.is_set():
+                return
+            if self.fresh(view, self.every):
+                self.skipped += 1
+                continue
+            self.limiter.acquire()
+            try:
+                self.load(view)
+                self.loaded += 1
+            except Exception:
+                self.errors += 1
+        self.passes += 1
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.every)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='prefetch', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {'passes': self.passes, 'loaded': self.loaded, 'skipped': self.skipped, 'errors': self.errors}
@@ -0,0 +1,186 @@
+import collections
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+import flask
+
+from metrics import callback_name
+
+SAMPLE_INTERVAL = 0.005
+# a sampler stops on its own after this long, so a hung request can't keep it running
+MAX_SECONDS = 60
+PROFILE_ID = re.compile(r'^[0-9]+-[0-9]+$')
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return '%s.%s:%d' % (frame.f_globals.get('__name__', '?'), code.co_name, code.co_firstlineno)
+
+
+class Sampler:
+    """Samples one thread's Python stack every ``interval`` seconds from a background thread.
+
+    The result is a count per collapsed stack (root first, frames joined by ``;``), the input format of
+    flamegraph.pl and speedscope. Only the sampled thread is seen, not work it hands to a pool.
+    """
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL, max_seconds=MAX_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+        return self
+
+    def _run(self):
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+                self.samples += 1
+
+
+class ProfileStore:
+    """Keeps the newest ``keep`` profiles as JSON files in ``directory``, shared by every worker."""
+
+    def __init__(self, directory, keep=50):
+        self.directory = directory
+        self.keep = keep
+        self._lock = threading.Lock()
+
+    def path(self, profile_id):
+        return os.path.join(self.directory, profile_id + '.json')
+
+    def ids(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        ids = [n[:-5] for n in names if n.endswith('.json') and PROFILE_ID.match(n[:-5])]
+        return sorted(ids, key=lambda i: tuple(int(p) for p in i.split('-')), reverse=True)
+
+    def save(self, profile):
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = '%d-%d' % (time.time() * 1000, os.getpid())
+        tmp = self.path(profile_id) + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(dict(profile, id=profile_id), f, default=str)
+        os.replace(tmp, self.path(profile_id))
+        with self._lock:
+            for old in self.ids()[self.keep:]:
+                try:
+                    os.remove(self.path(old))
+                except FileNotFoundError:
+                    pass
+        return profile_id
+
+    def load(self, profile_id):
+        if not PROFILE_ID.match(profile_id):
+            return None
+        try:
+            with open(self.path(profile_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+
+def collapsed(profile):
+    return ''.join('%s %d\n' % (stack, count) for stack, count in
+                   sorted(profile['stacks'].items(), key=lambda item: -item[1]))
+
+
+def install(server, callback_map, store, token=None, rate=0.0, min_ms=0):
+    """Profiles Dash callback requests and serves the results under /admin/profiles.
+
+    A request is profiled when it carries ``X-Profile: <token>``, or at random with probability ``rate``;
+    randomly sampled ones are only kept when they took at least ``min_ms``. Each profile records the callback,
+    its inputs and the collapsed stacks. The admin routes need the token too, as ``X-Admin-Token`` or
+    ``?token=``, and are only registered when one is configured.
+    """
+    def authorized(value):
+        return bool(token) and value is not None and hmac.compare_digest(value, token)
+
+    @server.before_request
+    def start_profile():
+        if not flask.request.path.endswith('/_dash-update-component'):
+            return
+        forced = authorized(flask.request.headers.get('X-Profile'))
+        if forced or (rate and random.random() < rate):
+            flask.g.profile = (forced, Sampler(threading.get_ident()).start())
+
+    @server.after_request
+    def finish_profile(response):
+        profile = flask.g.pop('profile', None)
+        if profile is None:
+            return response
+        forced, sampler = profile
+        sampler.stop()
+        if not forced and 1000 * sampler.duration < min_ms:
+            return response
+        body = flask.request.get_json(silent=True) or {}
+        profile_id = store.save({
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'callback': callback_name(callback_map, body),
+            'inputs': {'%s.%s' % (i['id'], i['property']): i.get('value')
+                       for i in body.get('inputs', []) + body.get('state', []) if isinstance(i, dict)},
+            'status': response.status_code,
+            'duration_ms': round(1000 * sampler.duration, 3),
+            'interval_ms': 1000 * sampler.interval,
+            'samples': sampler.samples,
+            'forced': forced,
+            'stacks': dict(sampler.stacks),
+        })
+        response.headers['X-Profile-Id'] = profile_id
+        return response
+
+    if not token:
+        return
+
+    def admin():
+        if not authorized(flask.request.headers.get('X-Admin-Token', flask.request.args.get('token'))):
+            flask.abort(404)
+
+    @server.route('/admin/profiles')
+    def profiles():
+        admin()
+        listing = []
+        for profile_id in store.ids():
+            profile = store.load(profile_id)
+            if profile is not None:
+                profile.pop('stacks')
+                listing.append(profile)
+        return flask.jsonify(listing)
+
+    @server.route('/admin/profiles/<profile_id>')
+    def profile(profile_id):
+        # collapsed stacks by default, for flamegraph.pl or speedscope; ?format=json for the whole record
+        admin()
+        found = store.load(profile_id)
+        if found is None:
+            flask.abort(404)
+        if flask.request.args.get('format') == 'json':
+            return flask.jsonify(found)
+        return flask.Response(collapsed(found), mimetype='text/plain')
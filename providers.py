@@ -0,0 +1,207 @@
+import os
+import zlib
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+from data_cache import PERIOD_OFFSETS, trim_period
+
+COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+
+class Provider:
+    """Source of OHLCV history. history() returns a frame indexed by bar start time with at least COLUMNS;
+    with start set (a 'YYYY-MM-DD' string) it returns every bar from that session on, otherwise the period."""
+
+    def history(self, tick, period, interval, start=None):
+        raise NotImplementedError
+
+    def history_many(self, ticks, period, interval, start=None):
+        return {tick: self.history(tick, period, interval, start=start) for tick in ticks}
+
+
+class YahooProvider(Provider):
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+
+    def history(self, tick, period, interval, start=None):
+        import yfinance as yf
+        ticker = yf.Ticker(tick)
+        if start is not None:
+            df = ticker.history(start=start, interval=interval, timeout=self.timeout)
+        else:
+            df = ticker.history(period=period, interval=interval, timeout=self.timeout)
+        return df.dropna()
+
+    def history_many(self, ticks, period, interval, start=None):
+        import yfinance as yf
+        ticks = list(ticks)
+        if len(ticks) < 2:
+            return super().history_many(ticks, period, interval, start=start)
+        if start is not None:
+            data = yf.download(ticks, start=start, interval=interval, group_by='ticker', auto_adjust=True,
+                               threads=True, progress=False, timeout=self.timeout)
+        else:
+            data = yf.download(ticks, period=period, interval=interval, group_by='ticker', auto_adjust=True,
+                               threads=True, progress=False, timeout=self.timeout)
+        return {tick: data[tick].dropna() for tick in ticks if tick in data.columns.get_level_values(0)}
+
+
+# NSE session used to lay out synthetic intraday bars
+SESSION_OPEN = pd.Timedelta(hours=9, minutes=15)
+SESSION_CLOSE = pd.Timedelta(hours=15, minutes=30)
+INTRADAY_FREQ = {'1m': '1min', '2m': '2min', '5m': '5min', '15m': '15min', '30m': '30min', '60m': '60min',
+                 '90m': '90min', '1h': '60min'}
+CALENDAR_FREQ = {'1d': 'B', '5d': '5B', '1wk': 'W-MON', '1mo': 'MS', '3mo': 'QS'}
+# how far back 'max' reaches for synthetic data, mirroring the limits yahoo puts on intraday history
+MAX_HISTORY = {'1m': pd.DateOffset(days=7), 'intraday': pd.DateOffset(days=60), 'calendar': pd.DateOffset(years=25)}
+
+
+def _mix(x):
+    # splitmix64 finaliser, vectorised; turns a timestamp and seed into well-spread uint64 noise
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _uniform(stamps, seed):
+    with np.errstate(over='ignore'):
+        return (_mix(stamps.astype('u8') ^ np.uint64(seed)) >> np.uint64(11)) / float(1 << 53)
+
+
+class LocalProvider(Provider):
+    """Deterministic offline provider.
+
+    Serves recorded bars from <root>/<ticker>/<interval>.csv when such a file exists, otherwise synthesises
+    bars on the NSE calendar. A synthetic bar depends only on the ticker and the session minutes it covers, so
+    overlapping requests, tail refreshes, separate processes and every interval all see the same prices.
+    """
+
+    def __init__(self, root=None, end=None):
+        self.root = root
+        self.end = None if end is None else pd.Timestamp(end)
+
+    def history(self, tick, period, interval, start=None):
+        df = self._recorded(tick, interval)
+        if df is None:
+            df = self._synthetic(tick, period, interval, start)
+        if start is not None:
+            first = pd.Timestamp(start)
+            if df.index.tz is not None:
+                first = first.tz_localize(df.index.tz)
+            return df[df.index >= first]
+        return trim_period(df, period)
+
+    def _recorded(self, tick, interval):
+        if self.root is None:
+            return None
+        path = os.path.join(self.root, quote(tick, safe=''), interval + '.csv')
+        if not os.path.exists(path):
+            return None
+        df = pd.read_csv(path, index_col=0)
+        df.index = pd.to_datetime(df.index)
+        if df.index.tz is not None:
+            df.index = df.index.tz_convert('Asia/Kolkata')
+        return df.dropna()
+
+    def _end(self):
+        end = self.end if self.end is not None else pd.Timestamp.now(tz='Asia/Kolkata')
+        return end.tz_localize('Asia/Kolkata') if end.tz is None else end
+
+    def _index(self, period, interval, start):
+        end = self._end()
+        intraday = interval in INTRADAY_FREQ
+        if start is not None:
+            first = pd.Timestamp(start).tz_localize('Asia/Kolkata')
+        elif period in PERIOD_OFFSETS:
+            first = end - PERIOD_OFFSETS[period]
+        elif period == 'ytd':
+            first = end.normalize().replace(month=1, day=1)
+        elif period.endswith('d') and period[:-1].isdigit():
+            # generous, trim_period cuts it back to the exact number of sessions
+            first = end - pd.DateOffset(days=2 * int(period[:-1]) + 4)
+        else:
+            first = end - MAX_HISTORY.get(interval, MAX_HISTORY['intraday' if intraday else 'calendar'])
+        first, end = first.tz_localize(None), end.tz_localize(None)
+        if not intraday:
+            # yfinance labels daily and coarser bars with naive exchange-local dates
+            return pd.date_range(first.normalize(), end, freq=CALENDAR_FREQ[interval])
+        days = pd.bdate_range(first.normalize(), end.normalize())
+        offsets = pd.timedelta_range(SESSION_OPEN, SESSION_CLOSE - pd.Timedelta(1), freq=INTRADAY_FREQ[interval])
+        index = pd.DatetimeIndex((days.values[:, None] + offsets.values[None, :]).ravel())
+        return index[index <= end].tz_localize('Asia/Kolkata')
+
+    def _minutes(self, local, interval):
+        # the first and last session minute each bar covers, in minutes since the epoch of exchange-local time
+        open_minutes, close_minutes = SESSION_OPEN // pd.Timedelta(minutes=1), SESSION_CLOSE // pd.Timedelta(minutes=1)
+        if interval in INTRADAY_FREQ:
+            first = local.values.view('i8') // 60000000000
+            day = local.normalize().values.view('i8') // 60000000000
+            step = pd.Timedelta(INTRADAY_FREQ[interval]) // pd.Timedelta(minutes=1)
+            last = np.minimum(first + step - 1, day + close_minutes - 1)
+        else:
+            days = local.values.astype('datetime64[D]')
+            ends = local.shift(1, freq=CALENDAR_FREQ[interval]).values.astype('datetime64[D]') - np.timedelta64(1, 'D')
+            first = np.busday_offset(days, 0, roll='forward').view('i8') * 1440 + open_minutes
+            last = np.busday_offset(ends, 0, roll='backward').view('i8') * 1440 + close_minutes - 1
+        # the forming bar closes at the latest minute there is
+        now = self._end().tz_localize(None).value // 60000000000
+        return first, np.maximum(first, np.minimum(last, now))
+
+    def _synthetic(self, tick, period, interval, start):
+        index = self._index(period, interval, start)
+        seed = zlib.crc32(tick.encode())
+        phase = (seed % 6283) / 1000.0
+        base = 50 + seed % 2000
+
+        def close_at(minutes):
+            # smooth multi-scale swing plus minute-level noise, a pure function of the ticker and the minute
+            days = minutes / 1440.0
+            swing = 0.25 * np.sin(days / 180.0 + phase) + 0.08 * np.sin(days / 23.0 + 2 * phase) \
+                + 0.02 * np.sin(days * 1.7 + 3 * phase)
+            return base * np.exp(swing + 0.01 * (_uniform(minutes, seed) - 0.5))
+
+        local = index.tz_localize(None) if index.tz is not None else index
+        first, last = self._minutes(local, interval)
+        # a bar opens where the minute before it closed and closes with its last minute, so a coarser bar has the
+        # open and close of the finer bars it covers
+        prev = close_at(first - 1)
+        close = close_at(last)
+        span = np.abs(close - prev) + close * 0.004 * _uniform(last, seed + 1)
+        high = np.maximum(prev, close) + span * _uniform(last, seed + 2)
+        low = np.minimum(prev, close) - span * _uniform(last, seed + 3)
+        volume = np.floor(1e5 * (1 + 9 * _uniform(last, seed + 4)) * (last - first + 1))
+        return pd.DataFrame({'Open': prev, 'High': high, 'Low': low, 'Close': close, 'Volume': volume},
+                            index=index, columns=COLUMNS)
+
+
+def record(provider, root, tick, period, interval):
+    # snapshot real bars so LocalProvider(root) can replay them later
+    path = os.path.join(root, quote(tick, safe=''))
+    os.makedirs(path, exist_ok=True)
+    df = provider.history(tick, period, interval)
+    df[COLUMNS].to_csv(os.path.join(path, interval + '.csv'))
+    return df
+
+
+def get_provider(timeout=None):
+    # MARKET_DATA_PROVIDER=local switches to the offline provider; MARKET_DATA_DIR holds recorded bars and
+    # MARKET_DATA_END pins the synthetic clock so runs are reproducible
+    if os.environ.get('MARKET_DATA_PROVIDER', 'yahoo') == 'local':
+        return LocalProvider(os.environ.get('MARKET_DATA_DIR'), os.environ.get('MARKET_DATA_END'))
+    return YahooProvider(timeout=timeout)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Record yahoo bars for replay through LocalProvider.')
+    parser.add_argument('root')
+    parser.add_argument('interval')
+    parser.add_argument('period')
+    parser.add_argument('ticks', nargs='+')
+    args = parser.parse_args()
+    for t in args.ticks:
+        print(t, len(record(YahooProvider(), args.root, t, args.period, args.interval)))
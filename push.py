@@ -0,0 +1,162 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+KEEPALIVE = 15
+QUEUE_SIZE = 16
+# channels produced at once; a slow upstream fetch for one key holds up only its own worker
+PUSH_WORKERS = 4
+
+
+class Subscription:
+
+    def __init__(self, hub, key):
+        self.hub = hub
+        self.key = key
+        self.messages = queue.Queue(maxsize=QUEUE_SIZE)
+        self.closed = False
+
+    def send(self, message):
+        try:
+            self.messages.put_nowait(message)
+        except queue.Full:
+            # deltas only apply in sequence, so a reader that fell behind is told to reconnect for a snapshot
+            self.closed = True
+
+    def get(self, timeout=KEEPALIVE):
+        try:
+            return self.messages.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.closed = True
+        self.hub.unsubscribe(self)
+
+
+class Channel:
+
+    def __init__(self, key):
+        self.key = key
+        self.subscribers = set()
+        self.snapshot = None
+        self.state = None
+        self.due = 0.0
+        self.producing = False
+
+
+class Hub:
+    """Fans one producer's updates for a key out to every subscriber of that key.
+
+    ``produce(key, state)`` returns ``(snapshot, update, state)``, or None when nothing changed since
+    ``state``; ``delay(key)`` says when to ask again. Each watched key is produced once per refresh however
+    many clients follow it, on a pool of ``workers`` threads, and published as soon as it is ready. A new
+    subscriber first gets the latest snapshot, then the updates after it.
+    """
+
+    def __init__(self, produce, delay, workers=PUSH_WORKERS):
+        self.produce = produce
+        self.delay = delay
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='push')
+        self.channels = {}
+        self.produced = 0
+        self.errors = 0
+        self.sent = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def subscribe(self, key):
+        sub = Subscription(self, key)
+        with self._lock:
+            channel = self.channels.get(key)
+            if channel is None:
+                channel = self.channels[key] = Channel(key)
+            channel.subscribers.add(sub)
+            if channel.snapshot is not None:
+                sub.send(channel.snapshot)
+            if self._thread is None:
+                # started on first use, so it runs in the process that serves the stream (never a pre-fork master)
+                self._thread = threading.Thread(target=self._run, name='push', daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            channel = self.channels.get(sub.key)
+            if channel is not None:
+                channel.subscribers.discard(sub)
+                if not channel.subscribers:
+                    del self.channels[sub.key]
+
+    def _publish(self, channel, snapshot, update):
+        with self._lock:
+            # everyone subscribed so far holds the previous snapshot, or has nothing yet on a new channel
+            message = update if channel.snapshot is not None else snapshot
+            channel.snapshot = snapshot
+            for sub in channel.subscribers:
+                sub.send(message)
+                self.sent += 1
+
+    def _produce(self, channel):
+        try:
+            produced = self.produce(channel.key, channel.state)
+        except Exception:
+            produced = None
+            with self._lock:
+                self.errors += 1
+        with self._lock:
+            self.produced += 1
+        if produced is not None:
+            snapshot, update, channel.state = produced
+            self._publish(channel, snapshot, update)
+        channel.due = time.monotonic() + self.delay(channel.key)
+        channel.producing = False
+        self._wake.set()
+
+    def run_once(self):
+        # hands every due channel to the pool and returns the seconds until the next one falls due
+        now = time.monotonic()
+        with self._lock:
+            due = [c for c in self.channels.values() if c.due <= now and not c.producing]
+            for channel in due:
+                channel.producing = True
+        for channel in due:
+            self.pool.submit(self._produce, channel)
+        with self._lock:
+            waiting = [c.due for c in self.channels.values() if not c.producing]
+            return min(waiting, default=now + KEEPALIVE) - time.monotonic()
+
+    def _run(self):
+        while True:
+            # cleared first, so a channel finishing while due times are read still wakes the next wait
+            self._wake.clear()
+            try:
+                wait = self.run_once()
+            except RuntimeError:
+                # the pool refuses work once the interpreter is shutting down
+                return
+            self._wake.wait(max(0.05, min(wait, KEEPALIVE)))
+
+    def stream(self, key):
+        # server-sent events for one key: JSON messages, and a comment line when idle to keep proxies from
+        # closing the connection
+        sub = self.subscribe(key)
+        try:
+            while not sub.closed:
+                message = sub.get()
+                if message is None:
+                    yield ': keepalive\n\n'
+                else:
+                    yield 'data: %s\n\n' % message
+            yield 'event: resync\ndata: {}\n\n'
+        finally:
+            sub.close()
+
+    def stats(self):
+        with self._lock:
+            return {'channels': len(self.channels),
+                    'subscribers': sum(len(c.subscribers) for c in self.channels.values()),
+                    'produced': self.produced, 'sent': self.sent, 'errors': self.errors}
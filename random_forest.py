@@ -1,4 +1,3 @@
-import yfinance as yf
 import talib
 from sklearn.model_selection import train_test_split
 from sklearn import metrics
@@ -9,9 +8,9 @@ from collections import Counter
 from imblearn.over_sampling import RandomOverSampler
 from sklearn.ensemble import RandomForestClassifier
 import matplotlib.pyplot as plt
+from providers import get_provider
 
-tick = yf.Ticker("RELIANCE.NS")
-df = tick.history('10y', '1d')
+df = get_provider().history("RELIANCE.NS", '10y', '1d')
 # print(df.isnull().sum())
 df = df.dropna()
 # df.drop(['Volume', 'Dividends', 'Stock Splits'], inplace=True, axis=1)
@@ -0,0 +1,83 @@
+import pandas as pd
+
+from data_cache import trim_period
+
+# NSE cash session opens at 09:15 IST, so intraday buckets are anchored there rather than on the hour
+SESSION_OPEN = pd.Timedelta(hours=9, minutes=15)
+
+INTRADAY_MINUTES = {'1m': 1, '2m': 2, '5m': 5, '15m': 15, '30m': 30, '60m': 60, '90m': 90, '1h': 60}
+CALENDAR_RULES = {'1d': 'D', '1wk': 'W-MON', '1mo': 'MS', '3mo': 'QS'}
+
+# which bar sizes each coarser bar size can be built from without straddling a bucket edge
+CALENDAR_SOURCES = {
+    '1d': set(INTRADAY_MINUTES),
+    '1wk': set(INTRADAY_MINUTES) | {'1d'},
+    '1mo': set(INTRADAY_MINUTES) | {'1d'},
+    '3mo': set(INTRADAY_MINUTES) | {'1d', '1mo'},
+}
+
+# periods ordered by how much history they span; 'ytd' only covers itself as its length varies over the year
+PERIOD_RANK = {'1d': 0, '5d': 1, '1mo': 2, '3mo': 3, '6mo': 4, '1y': 5, '2y': 6, '5y': 7, '10y': 8, 'max': 9}
+
+OHLCV_AGG = {'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'}
+
+
+def interval_rank(interval):
+    if interval in INTRADAY_MINUTES:
+        return INTRADAY_MINUTES[interval]
+    return {'1d': 1440, '1wk': 7 * 1440, '1mo': 31 * 1440, '3mo': 92 * 1440}.get(interval)
+
+
+def can_resample(source, target):
+    if source == target:
+        return True
+    if target in INTRADAY_MINUTES:
+        return source in INTRADAY_MINUTES and INTRADAY_MINUTES[target] % INTRADAY_MINUTES[source] == 0
+    return source in CALENDAR_SOURCES.get(target, ())
+
+
+def covers(source_period, target_period):
+    if source_period == target_period:
+        return True
+    if target_period == 'ytd':
+        return source_period in PERIOD_RANK and PERIOD_RANK[source_period] >= PERIOD_RANK['1y']
+    if source_period not in PERIOD_RANK or target_period not in PERIOD_RANK:
+        return False
+    return PERIOD_RANK[source_period] >= PERIOD_RANK[target_period]
+
+
+def resample_ohlcv(df, interval):
+    if df.empty:
+        return df[[c for c in OHLCV_AGG if c in df.columns]]
+    agg = {c: f for c, f in OHLCV_AGG.items() if c in df.columns}
+    if interval in INTRADAY_MINUTES:
+        minutes = INTRADAY_MINUTES[interval]
+        offset = pd.Timedelta(minutes=SESSION_OPEN.seconds // 60 % minutes)
+        out = df.resample('%dmin' % minutes, origin='start_day', offset=offset, label='left', closed='left').agg(agg)
+    else:
+        index = df.index
+        if index.tz is not None:
+            # bucket on the exchange-local calendar day, then label bars like yfinance daily data
+            index = index.tz_localize(None)
+        out = df.set_axis(index, axis=0).resample(CALENDAR_RULES[interval], label='left', closed='left').agg(agg)
+    return out.dropna(subset=['Open'])
+
+
+def plan_frames(specs):
+    # specs are (period, interval) pairs; returns {spec: source spec or None}, fetching the finest
+    # frames first so coarser ones can be aggregated from them instead of downloaded
+    order = sorted(set(specs), key=lambda s: (interval_rank(s[1]) or 0, -PERIOD_RANK.get(s[0], -1)))
+    plan = {}
+    for spec in order:
+        period, interval = spec
+        plan[spec] = None
+        for source in plan:
+            if plan[source] is None and source != spec and can_resample(source[1], interval) \
+                    and covers(source[0], period):
+                plan[spec] = source
+                break
+    return plan
+
+
+def derive_frame(df, period, interval):
+    return trim_period(resample_ohlcv(df, interval), period)
@@ -0,0 +1,67 @@
+import threading
+
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key into one.
+
+    The first caller for a key runs the function; callers arriving while it is in flight wait for it and get
+    the same result, or the same exception. A waiter gives up with TimeoutError after ``timeout`` seconds
+    without cancelling the call it was waiting on.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.collapsed = 0
+        self.errors = 0
+        self.timeouts = 0
+
+    def do(self, key, func, timeout=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                call.waiters += 1
+                self.collapsed += 1
+        if leader:
+            try:
+                call.result = func()
+            except Exception as e:
+                call.error = e
+                with self._lock:
+                    self.errors += 1
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        elif not call.done.wait(timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise TimeoutError('gave up waiting for %r after %ss' % (key, timeout))
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'collapsed': self.collapsed,
+                'collapse_ratio': self.collapsed / (self.calls + self.collapsed) if self.calls else 0.0,
+                'errors': self.errors,
+                'timeouts': self.timeouts,
+                'in_flight': len(self._calls),
+            }
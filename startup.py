@@ -0,0 +1,30 @@
+import json
+import os
+import sys
+import time
+
+# import this before anything heavy: stage times are measured from here
+STARTED = time.perf_counter()
+
+stages = []
+_last = STARTED
+
+
+def mark(stage):
+    global _last
+    now = time.perf_counter()
+    stages.append((stage, now - _last))
+    _last = now
+
+
+def report():
+    return {
+        'pid': os.getpid(),
+        'stages': {stage: round(seconds, 4) for stage, seconds in stages},
+        'total': round(_last - STARTED, 4),
+        'modules': len(sys.modules),
+    }
+
+
+def log(prefix='startup'):
+    print('%s %s' % (prefix, json.dumps(report())), file=sys.stderr, flush=True)
@@ -0,0 +1,432 @@
+import math
+import threading
+from collections import deque
+
+import numpy as np
+import pandas as pd
+import talib
+
+
+class Buffer:
+    """Growable array with amortised O(1) append."""
+
+    def __init__(self, capacity=256, dtype='f8'):
+        self.dtype = dtype
+        self.data = np.empty(capacity, dtype=dtype)
+        self.n = 0
+
+    def reset(self, values=None):
+        values = np.empty(0, dtype=self.dtype) if values is None else np.asarray(values, dtype=self.dtype)
+        self.data = np.empty(max(256, 2 * len(values)), dtype=self.dtype)
+        self.data[:len(values)] = values
+        self.n = len(values)
+
+    def append(self, value):
+        if self.n == len(self.data):
+            self.data = np.concatenate([self.data, np.empty(len(self.data), dtype=self.dtype)])
+        self.data[self.n] = value
+        self.n += 1
+
+    def __getitem__(self, i):
+        return self.data[i]
+
+    def __setitem__(self, i, value):
+        self.data[i] = value
+
+    def values(self):
+        return self.data[:self.n]
+
+
+class StreamingIndicator:
+    """Indicator that keeps running state so each new or revised bar costs O(1).
+
+    The last bar is always treated as still forming: push() commits it and starts a new one, revise()
+    recomputes it from the state committed up to the bar before. Outputs match the batch computation
+    load() seeds from. An indicator that ``slides`` only looks back over a fixed window, so bars dropped
+    from the head of the series can stay in its buffers: its results from a later start only need their
+    first ``warmup()`` values blanked to match a batch computation from that start.
+    """
+
+    columns = ('Close',)
+    outputs = 1
+    slides = False
+
+    def __init__(self, **params):
+        self.params = params
+        self.inputs = [Buffer() for _ in self.columns]
+        self.out = [Buffer() for _ in range(self.outputs)]
+        self.stamps = Buffer(dtype='i8')
+        self.n = 0
+        # the first bar of the series as last synced; buffers before it are stale
+        self.head = 0
+        self.lock = threading.Lock()
+        self._reset_state()
+
+    def load(self, arrays):
+        # seed from full history, by default one bar at a time
+        self.n = 0
+        for buf in self.inputs + self.out:
+            buf.reset()
+        self._reset_state()
+        for row in zip(*arrays):
+            self.push(*row)
+
+    def push(self, *values):
+        if self.n:
+            self._commit()
+        for buf, value in zip(self.inputs, values):
+            buf.append(value)
+        for buf in self.out:
+            buf.append(np.nan)
+        self.n += 1
+        self._compute()
+
+    def revise(self, *values):
+        for buf, value in zip(self.inputs, values):
+            buf[self.n - 1] = value
+        self._compute()
+
+    def result(self, start=0):
+        # views on the output buffers, valid until the stream next changes. Bars before a later start are never
+        # looked at again, so its warmup values are blanked in place
+        results = [buf.values()[start:] for buf in self.out]
+        if start:
+            for values in results:
+                values[:self.warmup()] = np.nan
+        return results[0] if self.outputs == 1 else tuple(results)
+
+    def warmup(self):
+        return 0
+
+    def nbytes(self):
+        return sum(buf.data.nbytes for buf in self.inputs + self.out + [self.stamps])
+
+    def _reset_state(self):
+        pass
+
+    def _commit(self):
+        pass
+
+    def _compute(self):
+        raise NotImplementedError
+
+
+class WindowSum:
+    # sum (and sum of squares) of the period - 1 committed values before the forming bar
+
+    def __init__(self, period):
+        self.period = period
+        self.total = 0.0
+        self.squares = 0.0
+
+    def seed(self, x):
+        last = len(x) - 1
+        window = x[max(0, last - self.period + 1):last]
+        self.total = float(window.sum())
+        self.squares = float((window * window).sum())
+
+    def commit(self, x, last):
+        # fold bar `last` in and drop the one that falls out of the next bar's window
+        self.total += x[last]
+        self.squares += x[last] * x[last]
+        first = last - self.period + 1
+        if first >= 0:
+            self.total -= x[first]
+            self.squares -= x[first] * x[first]
+
+
+class MovingAverage(StreamingIndicator):
+    slides = True
+
+    def warmup(self):
+        return self.params['timeperiod'] - 1
+
+    def _reset_state(self):
+        self.window = WindowSum(self.params['timeperiod'])
+
+    def load(self, arrays):
+        x = np.asarray(arrays[0], dtype='f8')
+        self.inputs[0].reset(x)
+        self.out[0].reset(talib.MA(x, timeperiod=self.params['timeperiod'], matype=0))
+        self.n = len(x)
+        self._reset_state()
+        self.window.seed(x)
+
+    def _commit(self):
+        self.window.commit(self.inputs[0], self.n - 1)
+
+    def _compute(self):
+        last = self.n - 1
+        if last >= self.params['timeperiod'] - 1:
+            self.out[0][last] = (self.window.total + self.inputs[0][last]) / self.params['timeperiod']
+
+
+class ExponentialMovingAverage(StreamingIndicator):
+
+    def _reset_state(self):
+        self.window = WindowSum(self.params['timeperiod'])
+        self.prev = np.nan
+
+    def load(self, arrays):
+        x = np.asarray(arrays[0], dtype='f8')
+        out = talib.EMA(x, timeperiod=self.params['timeperiod'])
+        self.inputs[0].reset(x)
+        self.out[0].reset(out)
+        self.n = len(x)
+        self._reset_state()
+        self.window.seed(x)
+        self.prev = out[-2] if len(x) > 1 else np.nan
+
+    def _commit(self):
+        self.window.commit(self.inputs[0], self.n - 1)
+        self.prev = self.out[0][self.n - 1]
+
+    def _compute(self):
+        period = self.params['timeperiod']
+        last = self.n - 1
+        x = self.inputs[0][last]
+        if last == period - 1:
+            # TA-Lib seeds the EMA with the simple average of the first period
+            self.out[0][last] = (self.window.total + x) / period
+        elif last >= period:
+            k = 2.0 / (period + 1)
+            self.out[0][last] = (x - self.prev) * k + self.prev
+
+
+class BollingerBands(StreamingIndicator):
+    outputs = 3
+    slides = True
+
+    def warmup(self):
+        return self.params['timeperiod'] - 1
+
+    def _reset_state(self):
+        self.window = WindowSum(self.params['timeperiod'])
+
+    def load(self, arrays):
+        x = np.asarray(arrays[0], dtype='f8')
+        nbdev = self.params['nbdev']
+        bands = talib.BBANDS(x, timeperiod=self.params['timeperiod'], nbdevup=nbdev, nbdevdn=nbdev, matype=0)
+        self.inputs[0].reset(x)
+        for buf, values in zip(self.out, bands):
+            buf.reset(values)
+        self.n = len(x)
+        self._reset_state()
+        self.window.seed(x)
+
+    def _commit(self):
+        self.window.commit(self.inputs[0], self.n - 1)
+
+    def _compute(self):
+        period = self.params['timeperiod']
+        last = self.n - 1
+        if last < period - 1:
+            return
+        x = self.inputs[0][last]
+        middle = (self.window.total + x) / period
+        # population variance from running sums, as TA-Lib's STDDEV does
+        variance = (self.window.squares + x * x) / period - middle * middle
+        deviation = math.sqrt(variance) if variance > 0 else 0.0
+        self.out[0][last] = middle + self.params['nbdev'] * deviation
+        self.out[1][last] = middle
+        self.out[2][last] = middle - self.params['nbdev'] * deviation
+
+
+class RollingExtreme(StreamingIndicator):
+    # rolling max (or min) over a monotonic deque of committed bar positions
+    sign = 1
+    slides = True
+
+    def warmup(self):
+        return self.params['window'] - 1
+
+    def _reset_state(self):
+        self.positions = deque()
+
+    def load(self, arrays):
+        x = np.asarray(arrays[0], dtype='f8')
+        window = self.params['window']
+        rolling = pd.Series(x).rolling(window=window)
+        self.inputs[0].reset(x)
+        self.out[0].reset((rolling.max() if self.sign > 0 else rolling.min()).values)
+        self.n = len(x)
+        self._reset_state()
+        for i in range(max(0, self.n - window), self.n - 1):
+            self._fold(i)
+
+    def _fold(self, i):
+        x = self.inputs[0]
+        while self.positions and self.sign * x[self.positions[-1]] <= self.sign * x[i]:
+            self.positions.pop()
+        self.positions.append(i)
+
+    def _commit(self):
+        self._fold(self.n - 1)
+
+    def _compute(self):
+        window = self.params['window']
+        last = self.n - 1
+        if last < window - 1:
+            return
+        while self.positions and self.positions[0] <= last - window:
+            self.positions.popleft()
+        x = self.inputs[0]
+        value = x[last]
+        if self.positions and self.sign * x[self.positions[0]] > self.sign * value:
+            value = x[self.positions[0]]
+        self.out[0][last] = value
+
+
+class RollingHigh(RollingExtreme):
+    columns = ('High',)
+    sign = 1
+
+
+class RollingLow(RollingExtreme):
+    columns = ('Low',)
+    sign = -1
+
+
+class ParabolicSAR(StreamingIndicator):
+    # a straight port of TA-Lib's SAR loop, split into a per-bar step; the chart feeds closes in as the lows
+    columns = ('High', 'Close')
+
+    def _reset_state(self):
+        self.state = None
+        self.pending = None
+
+    def load(self, arrays):
+        # TA-Lib computes the history; only the current trend, from its last reversal, is replayed in Python to
+        # recover the running state, since a reversal bar's output fixes everything the next step needs
+        high, low = (np.asarray(a, dtype='f8') for a in arrays)
+        n = len(high)
+        out = talib.SAR(high, low, acceleration=self.params['acceleration'], maximum=self.params['maximum'])
+        # bars 0..n-2 are committed; a long bar's SAR sits at or below its low, a short one's above
+        is_long = out[1:n - 1] <= low[1:n - 1]
+        flips = np.flatnonzero(is_long[1:] != is_long[:-1]) + 2
+        if not len(flips):
+            super().load(arrays)
+            return
+        r = flips[-1]
+        self.inputs[0].reset(high)
+        self.inputs[1].reset(low)
+        self.out[0].reset(out)
+        self._reset_state()
+        acceleration = min(self.params['acceleration'], self.params['maximum'])
+        if is_long[r - 1]:
+            ep = high[r]
+            sar = min(out[r] + acceleration * (ep - out[r]), low[r - 1], low[r])
+        else:
+            ep = low[r]
+            sar = max(out[r] + acceleration * (ep - out[r]), high[r - 1], high[r])
+        self.pending = (bool(is_long[r - 1]), sar, ep, acceleration, low[r], high[r])
+        for i in range(r + 1, n):
+            self.n = i + 1
+            self._commit()
+            self._compute()
+        self.n = n
+        replayed = self.out[0].values()[r + 1:]
+        if not np.allclose(replayed, out[r + 1:], rtol=1e-9, atol=0, equal_nan=True):
+            # a bar exactly on its SAR makes the direction ambiguous; step through the whole series instead
+            super().load(arrays)
+
+    def _commit(self):
+        self.state = self.pending
+
+    def _initial(self):
+        high, low = self.inputs
+        # the starting direction follows the one-bar -DM of the first two bars
+        down = low[0] - low[1]
+        up = high[1] - high[0]
+        is_long = not (down > 0 and up < down)
+        if is_long:
+            ep, sar = high[1], low[0]
+        else:
+            ep, sar = low[1], high[0]
+        return is_long, sar, ep, min(self.params['acceleration'], self.params['maximum']), low[1], high[1]
+
+    def _compute(self):
+        last = self.n - 1
+        if last < 1:
+            return
+        acceleration = min(self.params['acceleration'], self.params['maximum'])
+        maximum = self.params['maximum']
+        is_long, sar, ep, af, new_low, new_high = self._initial() if last == 1 else self.state
+        prev_low, prev_high = new_low, new_high
+        new_high, new_low = self.inputs[0][last], self.inputs[1][last]
+        if is_long:
+            if new_low <= sar:
+                is_long = False
+                sar = max(ep, prev_high, new_high)
+                output = sar
+                af = acceleration
+                ep = new_low
+                sar = max(sar + af * (ep - sar), prev_high, new_high)
+            else:
+                output = sar
+                if new_high > ep:
+                    ep = new_high
+                    af = min(af + acceleration, maximum)
+                sar = min(sar + af * (ep - sar), prev_low, new_low)
+        else:
+            if new_high >= sar:
+                is_long = True
+                sar = min(ep, prev_low, new_low)
+                output = sar
+                af = acceleration
+                ep = new_high
+                sar = min(sar + af * (ep - sar), prev_low, new_low)
+            else:
+                output = sar
+                if new_low < ep:
+                    ep = new_low
+                    af = min(af + acceleration, maximum)
+                sar = max(sar + af * (ep - sar), prev_high, new_high)
+        self.out[0][last] = output
+        self.pending = (is_long, sar, ep, af, new_low, new_high)
+
+
+STREAMS = {
+    'ma': MovingAverage,
+    'ema': ExponentialMovingAverage,
+    'bbands': BollingerBands,
+    'sar': ParabolicSAR,
+    'rolling_high': RollingHigh,
+    'rolling_low': RollingLow,
+}
+
+
+def _same(a, b):
+    return a == b or (a != a and b != b)
+
+
+def sync(stream, df):
+    # bring the stream level with df. When df holds the bars the stream committed, unchanged, the forming bar is
+    # revised and newer ones pushed; a sliding indicator also skips bars df has dropped from its head. Anything
+    # else (revised history such as a dividend adjustment, a gap, a different series) reseeds from df.
+    # Unchanged is judged in O(1), from the stamps and values at both ends of the committed bars: an adjustment
+    # rescales the first bar, a gap or a different series moves the stamps
+    stamps = df.index.asi8
+    arrays = [np.ascontiguousarray(df[c].values, dtype='f8') for c in stream.columns]
+    k = stream.n
+    held = stream.stamps.values()
+    start = int(np.searchsorted(held, stamps[0])) if k and len(df) else 0
+    # bars of the stream df repeats, the last of them still forming
+    m = k - start
+    reuse = (0 < m <= len(df) and (start == 0 or stream.slides)
+             # bars dropped from the head are kept until they outnumber the series, then the stream is compacted
+             and stream.head <= start <= len(df)
+             and held[start] == stamps[0] and held[k - 1] == stamps[m - 1]
+             and (m < 2 or all(_same(buf[start], a[0]) and _same(buf[k - 2], a[m - 2])
+                               for buf, a in zip(stream.inputs, arrays))))
+    if reuse:
+        stream.revise(*[a[m - 1] for a in arrays])
+        for i in range(m, len(df)):
+            stream.push(*[a[i] for a in arrays])
+            stream.stamps.append(stamps[i])
+    else:
+        stream.load(arrays)
+        stream.stamps.reset(stamps)
+        start = 0
+    stream.head = start
+    return stream.result(start)
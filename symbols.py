@@ -0,0 +1,77 @@
+import bisect
+
+import pandas as pd
+
+DEFAULT_LIMIT = 50
+
+
+class SymbolIndex:
+    """Ticker and company name search over the symbol table.
+
+    Matches are ranked ticker prefix, then name prefix, then any word of the name, then any substring of
+    the ticker or name; each tier is a bisect into a sorted key list, and the substring tier a scan of one
+    joined string, so a query costs well under a millisecond for the ~4,600 listed symbols.
+    """
+
+    def __init__(self, tickers, names):
+        self.tickers = list(tickers)
+        self.options = [{'label': str(name) + '-\t' + str(tick), 'value': tick} for tick, name in zip(tickers, names)]
+        self.by_value = {option['value']: option for option in self.options}
+        self._tickers = sorted((str(t).lower(), i) for i, t in enumerate(self.tickers))
+        self._names = sorted((str(n).lower(), i) for i, n in enumerate(names))
+        self._words = sorted((word, i) for i, n in enumerate(names) for word in str(n).lower().split()[1:])
+        # one line per symbol, searched with str.find; _starts maps an offset back to its row
+        lines = [(str(t) + ' ' + str(n)).lower() for t, n in zip(self.tickers, names)]
+        self._text = '\n'.join(lines)
+        self._starts = []
+        offset = 0
+        for line in lines:
+            self._starts.append(offset)
+            offset += len(line) + 1
+
+    @classmethod
+    def from_csv(cls, path):
+        df = pd.read_csv(path, encoding='latin-1')
+        return cls(df['Ticker'].tolist(), df['Name'].tolist())
+
+    def _prefixed(self, keys, query):
+        pos = bisect.bisect_left(keys, (query,))
+        while pos < len(keys) and keys[pos][0].startswith(query):
+            yield keys[pos][1]
+            pos += 1
+
+    def _containing(self, query):
+        pos = self._text.find(query)
+        while pos != -1:
+            row = bisect.bisect_right(self._starts, pos) - 1
+            yield row
+            # carry on from the next line, one hit per symbol is enough
+            nxt = self._starts[row + 1] if row + 1 < len(self._starts) else len(self._text)
+            pos = self._text.find(query, nxt)
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        query = (query or '').strip().lower()
+        if not query:
+            return list(range(min(limit, len(self.tickers))))
+        found = []
+        seen = set()
+        for tier in (self._prefixed(self._tickers, query), self._prefixed(self._names, query),
+                     self._prefixed(self._words, query), self._containing(query)):
+            for row in tier:
+                if row not in seen:
+                    seen.add(row)
+                    found.append(row)
+                    if len(found) == limit:
+                        return found
+        return found
+
+    def dropdown_options(self, query, selected=None, limit=DEFAULT_LIMIT):
+        # the dropdown can only label values that are among its options, so the selection is always included
+        if selected is None:
+            selected = []
+        elif not isinstance(selected, list):
+            selected = [selected]
+        options = [self.by_value[v] for v in selected if v in self.by_value]
+        chosen = set(selected)
+        options.extend(self.options[row] for row in self.search(query, limit) if self.tickers[row] not in chosen)
+        return options
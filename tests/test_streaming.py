@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from indicators import REGISTRY, fingerprint
+from streaming import STREAMS, ParabolicSAR, sync
+
+PARAMS = {
+    'ma': {'timeperiod': 20},
+    'ema': {'timeperiod': 9},
+    'bbands': {'timeperiod': 20, 'nbdev': 2},
+    'sar': {'acceleration': 0.02, 'maximum': 0.2},
+    'rolling_high': {'window': 9},
+    'rolling_low': {'window': 9},
+}
+
+
+def bars(n, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 1000 + np.cumsum(rng.normal(0, 5, n))
+    high = close + rng.uniform(0, 4, n)
+    low = close - rng.uniform(0, 4, n)
+    open = close + rng.normal(0, 2, n)
+    index = pd.date_range('2021-01-04 09:15', periods=n, freq='T', tz='Asia/Kolkata')
+    return pd.DataFrame({'Open': open, 'High': high, 'Low': low, 'Close': close, 'Volume': 1000.0}, index=index)
+
+
+def batch(name, df):
+    func, deps, defaults = REGISTRY[name]
+    return func(df, **PARAMS[name])
+
+
+def assert_matches(name, streamed, df):
+    expected = batch(name, df)
+    if not isinstance(expected, tuple):
+        expected, streamed = (expected,), (streamed,)
+    for got, want in zip(streamed, expected):
+        np.testing.assert_allclose(got, want, rtol=1e-9, atol=1e-9, equal_nan=True)
+
+
+@pytest.mark.parametrize('name', sorted(STREAMS))
+def test_growing_series_matches_talib(name):
+    df = bars(600)
+    stream = STREAMS[name](**PARAMS[name])
+    sync(stream, df.iloc[:400])
+    for end in range(401, 600):
+        # the forming bar moves before the next one starts
+        forming = df.iloc[:end].copy()
+        forming.iloc[-1, forming.columns.get_loc('Close')] += 1.5
+        sync(stream, forming)
+        assert_matches(name, sync(stream, df.iloc[:end]), df.iloc[:end])
+
+
+@pytest.mark.parametrize('name', sorted(STREAMS))
+def test_revised_history_reseeds(name):
+    df = bars(500)
+    stream = STREAMS[name](**PARAMS[name])
+    sync(stream, df)
+    adjusted = df.copy()
+    adjusted[['Open', 'High', 'Low', 'Close']] *= 0.9
+    assert_matches(name, sync(stream, adjusted), adjusted)
+
+
+@pytest.mark.parametrize('name', sorted(STREAMS))
+def test_sliding_window_matches_talib(name):
+    # a trimmed period drops a head bar for every new one
+    df = bars(800)
+    stream = STREAMS[name](**PARAMS[name])
+    for end in range(300, 800, 7):
+        window = df.iloc[end - 300:end]
+        assert_matches(name, sync(stream, window), window)
+
+
+def test_sliding_window_keeps_running_state():
+    df = bars(400)
+    stream = STREAMS['ma'](**PARAMS['ma'])
+    sync(stream, df.iloc[:300])
+    sync(stream, df.iloc[1:301])
+    assert stream.n == 301
+
+
+def test_sar_batch_seed_matches_per_bar_replay():
+    df = bars(1000, seed=3)
+    arrays = [df['High'].values, df['Close'].values]
+    seeded, stepped = ParabolicSAR(**PARAMS['sar']), ParabolicSAR(**PARAMS['sar'])
+    seeded.load(arrays)
+    super(ParabolicSAR, stepped).load(arrays)
+    np.testing.assert_allclose(seeded.result(), stepped.result(), rtol=1e-9, equal_nan=True)
+    for i in range(1, 50):
+        bar = [1000 + i, 999 + i]
+        seeded.push(*bar)
+        stepped.push(*bar)
+    np.testing.assert_allclose(seeded.result(), stepped.result(), rtol=1e-9, equal_nan=True)
+
+
+def test_result_is_a_view_on_the_stream():
+    df = bars(300)
+    stream = STREAMS['ma'](**PARAMS['ma'])
+    assert np.shares_memory(sync(stream, df), stream.out[0].data)
+
+
+def test_fingerprint_sees_revised_ends():
+    df = bars(300)
+    tail, head = df.copy(), df.copy()
+    tail.iloc[-1, tail.columns.get_loc('Close')] += 1
+    head[['Open', 'High', 'Low', 'Close']] *= 0.9
+    assert len({fingerprint(df), fingerprint(tail), fingerprint(head), fingerprint(df.iloc[:-1])}) == 4